@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Restaurant.settings')
 
 application = get_asgi_application()
+
+
+# Background job workers for this process (see BACKGROUND_JOBS_WORKERS)
+from rest.jobs import start_workers  # noqa: E402
+
+start_workers()
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,11 +49,24 @@ AUTH_USER_MODEL = 'rest.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'rest.authentication.CachedJWTAuthentication',
     ),
      'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 5
+    'PAGE_SIZE': 5,
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
+# MessagePack for the in-house POS clients, when the optional msgpack package is installed
+if find_spec('msgpack') is not None:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('rest.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('rest.renderers.MessagePackParser')
 from datetime import timedelta
 
 SIMPLE_JWT = {
@@ -59,8 +74,71 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'rest.authentication.RoleTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'rest.authentication.RoleTokenRefreshSerializer',
 }
+# Authenticated users are cached per process for this long; saving a User
+# evicts it at once in this process, other processes pick it up within the TTL.
+AUTH_USER_CACHE_SECONDS = 60
+AUTH_USER_CACHE_SIZE = 10000
+# Put role/staff claims in access tokens and authenticate requests from them
+# without a lookup; role changes then apply from the next token refresh.
+JWT_TRUST_ROLE_CLAIMS = False
+# Kitchen scheduler: parallel prep stations, target minutes from order to
+# service (the scheduling deadline) and how often a worker re-plans from the DB.
+KITCHEN_STATIONS = 3
+KITCHEN_SERVICE_MINUTES = 20
+KITCHEN_REFRESH_SECONDS = 60
+
+# The catalog version and the cached menu (rest.catalog, rest.menu) must be
+# shared by every worker process, or a catalog write in one leaves the others
+# serving the old menu. Set CACHE_URL to a Redis URL such as
+# redis://127.0.0.1:6379/0 (needs the redis package). Without it each process
+# has its own LocMemCache, which only suits a single process and tests, and
+# `check --deploy` warns.
+if os.environ.get('CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_URL'],
+        },
+    }
+
+# Order events pushed over SSE at /api/async/orders/events/. The in-memory
+# broker only reaches clients of the same process; swap in a shared one when
+# running more than one ASGI worker.
+ORDER_EVENTS_BROKER = 'rest.events.InMemoryBroker'
+ORDER_EVENTS_HEARTBEAT_SECONDS = 15
+
+# Background jobs (rest.jobs): worker threads per process, started by the
+# WSGI/ASGI entry points; 0 leaves the queue to `manage.py run_jobs`. A failed
+# job is retried after RETRY_SECONDS, doubling per attempt, and one whose
+# worker went away after LEASE_SECONDS. Done jobs, and so their idempotency
+# keys, are kept for KEEP_HOURS.
+BACKGROUND_JOBS_WORKERS = int(os.environ.get('BACKGROUND_JOBS_WORKERS', 2))
+BACKGROUND_JOBS_POLL_SECONDS = 5
+BACKGROUND_JOBS_RETRY_SECONDS = 10
+BACKGROUND_JOBS_LEASE_SECONDS = 300
+BACKGROUND_JOBS_KEEP_HOURS = 24
+
+# Order creation responses are stored under the client's Idempotency-Key
+# header and replayed to retries for this long.
+IDEMPOTENCY_KEY_SECONDS = 24 * 60 * 60
+
+# Product search: the SQLite FTS5 index, or 'rest.search.LikeBackend' on
+# databases without it
+PRODUCT_SEARCH_BACKEND = 'rest.search.SQLiteFTSBackend'
+
+# Per-endpoint query/latency metrics, scraped from /api/metrics/ by staff or
+# with the X-Metrics-Token header; a statement repeated this many times in one
+# request is reported as a possible N+1.
+REQUEST_METRICS_ENABLED = True
+REQUEST_METRICS_DUPLICATE_THRESHOLD = 5
+REQUEST_METRICS_TOKEN = os.environ.get('REQUEST_METRICS_TOKEN')
+
 MIDDLEWARE = [
+    'rest.instrumentation.RequestMetricsMiddleware',
+    'rest.db_routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -93,13 +171,70 @@ WSGI_APPLICATION = 'Restaurant.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connections are kept open for DATABASE_CONN_MAX_AGE seconds (0 closes them
+# after each request) and checked before reuse when health checks are on.
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 60))
+DATABASE_CONN_HEALTH_CHECKS = os.environ.get('DATABASE_CONN_HEALTH_CHECKS', '1') == '1'
+
+# Run on every new SQLite connection. WAL lets reads proceed during a write
+# and, with synchronous=NORMAL, commits without an fsync per transaction;
+# busy_timeout (ms) is how long a writer waits for the lock before failing;
+# a negative cache_size is in KiB.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DATABASE_CONN_HEALTH_CHECKS,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            # Transactions take the write lock at BEGIN, so two writers
+            # queue on busy_timeout instead of one failing when it upgrades
+            # a read lock
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Write paths decorated with rest.retry.retry_on_lock (order saves, batch
+# creation) are retried this many times when BEGIN's lock wait still times
+# out, starting DATABASE_LOCK_RETRY_DELAY seconds apart and doubling.
+DATABASE_LOCK_RETRIES = 3
+DATABASE_LOCK_RETRY_DELAY = 0.05
+
+# Read replicas, as a comma-separated list of database files kept in sync
+# with the primary, e.g. DATABASE_REPLICAS=/srv/replica1.sqlite3,/srv/replica2.sqlite3.
+# Safe requests read from them; a client that wrote reads from the primary
+# for DATABASE_REPLICA_PIN_SECONDS, which should exceed the replication lag
+# (see rest.db_routers for how clients without cookies stay pinned).
+DATABASE_READ_REPLICAS = []
+for number, name in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME': name.strip(),
+        # Only read from, so BEGIN IMMEDIATE would just contend for the write lock
+        'OPTIONS': {
+            option: value for option, value in DATABASES['default']['OPTIONS'].items()
+            if option != 'transaction_mode'
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_READ_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['rest.db_routers.PrimaryReplicaRouter']
+DATABASE_REPLICA_PIN_SECONDS = 15
+
+# Adds stand-in replica databases for the routing tests
+TEST_RUNNER = 'rest.runner.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Restaurant.settings')
 
 application = get_wsgi_application()
+
+
+# Background job workers for this process (see BACKGROUND_JOBS_WORKERS)
+from rest.jobs import start_workers  # noqa: E402
+
+start_workers()
@@ -1,5 +1,7 @@
 from django.contrib import admin
+from django.utils import timezone
 from .models import Category, Product
+from .search import get_search_backend
 
 admin.site.register(Category)
 
@@ -9,8 +11,35 @@ admin.site.register(Customer)
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'price', 'category', 'is_available')
+    list_display = ('name', 'price', 'category', 'is_available', 'stock')
     list_filter = ('category', 'is_available')
     search_fields = ('name', 'description')
-    list_editable = ('price', 'is_available')
+    # is_available follows stock for tracked products (Product.save), so it is
+    # only editable on the change form of products without tracked stock
+    list_editable = ('price', 'stock')
 
+    def get_readonly_fields(self, request, obj=None):
+        if obj is not None and obj.stock is not None:
+            return ('is_available',)
+        return ()
+
+    def get_search_results(self, request, queryset, search_term):
+        # The search index instead of LIKE scans over search_fields
+        if not search_term.strip():
+            return queryset, False
+        return get_search_backend().search(queryset, search_term), False
+
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('task', 'status', 'attempts', 'run_after', 'finished_at')
+    list_filter = ('status', 'task')
+    readonly_fields = ('task', 'payload', 'key', 'attempts', 'locked_until', 'last_error', 'created_at', 'finished_at')
+    actions = ['retry']
+
+    @admin.action(description="Queue again now")
+    def retry(self, request, queryset):
+        queryset.exclude(status='running').update(status='queued', attempts=0, run_after=timezone.now())
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class RestConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rest'
+
+    def ready(self):
+        # signals (including the metrics' connection hook), system checks,
+        # and the modules registering background tasks for rest.jobs
+        from . import checks, idempotency, instrumentation, signals  # noqa: F401
@@ -0,0 +1,191 @@
+"""Async versions of the hot read endpoints, for the ASGI deployment.
+
+DRF views are synchronous, so under ASGI every request to them is handed
+to a worker thread for its whole duration. These plain Django async views
+cover the paths clients poll (product list, availability, menu, order
+status) with the async ORM and async cache, so while a poll waits on the
+database or cache the event loop keeps serving other clients. A poll
+answered with 304 costs the user lookup and nothing else.
+
+They answer with the same JSON as their DRF counterparts and use the same
+JWT authentication, but only render JSON, and the product list always
+pages by cursor (``?cursor=`` style, see KeysetPagination).
+
+The order events stream (Server-Sent Events) lives here too: it holds a
+connection open per screen, which only an async view can do cheaply.
+"""
+import asyncio
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .authentication import CachedJWTAuthentication
+from .conditional import async_catalog_conditional
+from .events import get_broker
+from .fast_serializers import fast_product_serializer
+from .menu import menu_engine
+from .models import Order, Product
+from .renderers import FastJSONRenderer
+from .views import ProductFilter, ProductPagination
+
+jwt_authentication = CachedJWTAuthentication()
+renderer = FastJSONRenderer()
+
+
+def json_response(data, status=200):
+    return HttpResponse(renderer.render(data), status=status, content_type=renderer.media_type)
+
+
+async def authenticate(request):
+    """The active user for the request's JWT, or None."""
+    header = jwt_authentication.get_header(request)
+    raw_token = jwt_authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        token = jwt_authentication.get_validated_token(raw_token)
+        return await jwt_authentication.aget_user(token)
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+
+
+def authenticated(view):
+    """Reject requests without a valid access token, like IsAuthenticated."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await authenticate(request)
+        if user is None:
+            response = json_response(
+                {'detail': 'Authentication credentials were not provided.'}, status=401,
+            )
+            response['WWW-Authenticate'] = 'Bearer realm="api"'
+            return response
+        request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+@require_safe
+@authenticated
+@async_catalog_conditional
+async def product_list(request):
+    filterset = ProductFilter(request.GET, queryset=Product.objects.all())
+    # Validating the category filter looks the category up
+    if not await sync_to_async(filterset.is_valid)():
+        return json_response(filterset.errors, status=400)
+
+    paginator = ProductPagination()
+    rows = await paginator.apaginate_queryset(
+        fast_product_serializer.values(filterset.qs), Request(request),
+    )
+    return json_response({
+        'next': paginator.get_next_link(),
+        'results': fast_product_serializer.many(rows),
+    })
+
+
+@require_safe
+@authenticated
+async def check_availability(request, pk):
+    product = await Product.objects.filter(pk=pk).values('id', 'name', 'is_available').afirst()
+    if product is None:
+        return json_response({'detail': 'No Product matches the given query.'}, status=404)
+    return json_response({
+        'product_id': product['id'],
+        'product_name': product['name'],
+        'is_available': product['is_available'],
+        'message': 'Available for order' if product['is_available'] else 'Currently unavailable',
+    })
+
+
+@require_safe
+@authenticated
+@async_catalog_conditional
+async def menu_by_category(request):
+    return json_response(await menu_engine.aget_menu())
+
+
+@require_safe
+@authenticated
+async def order_status(request, pk):
+    order = await (
+        Order.objects.filter(pk=pk)
+        .values('id', 'status', 'total_amount', 'order_date')
+        .afirst()
+    )
+    if order is None:
+        return json_response({'detail': 'No Order matches the given query.'}, status=404)
+    return json_response({
+        'order_id': order['id'],
+        'status': order['status'],
+        'total_amount': str(order['total_amount']),
+        'order_date': order['order_date'],
+    })
+
+
+class EventStream:
+    """SSE body whose close() drops the subscription when the response is closed."""
+
+    def __init__(self, events, subscription):
+        self.events = events
+        self.subscription = subscription
+
+    def __aiter__(self):
+        return self.events
+
+    def close(self):
+        self.subscription.close()
+
+
+@require_safe
+@authenticated
+async def order_events(request):
+    """Server-Sent Events stream of order changes.
+
+    ``?status=pending,completed`` and ``?customer=`` narrow the stream. A
+    reconnecting EventSource sends Last-Event-ID and gets the events it
+    missed, as far back as the broker keeps them. A comment line goes out
+    every ORDER_EVENTS_HEARTBEAT_SECONDS so proxies keep idle streams open.
+    """
+    statuses = set(filter(None, request.GET.get('status', '').split(',')))
+    customer = request.GET.get('customer')
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+    heartbeat = getattr(settings, 'ORDER_EVENTS_HEARTBEAT_SECONDS', 15)
+    subscription = get_broker().subscribe(last_event_id)
+
+    def wanted(event):
+        order = event['order']
+        if statuses and order['status'] not in statuses:
+            return False
+        return customer is None or str(order['customer']) == customer
+
+    async def stream():
+        # A client disconnect cancels the streaming task inside this loop
+        try:
+            yield f'retry: {heartbeat * 1000}\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(anext(subscription), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                if wanted(event):
+                    data = json.dumps({key: value for key, value in event.items() if key != 'id'})
+                    yield f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(EventStream(stream(), subscription), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,156 @@
+"""JWT authentication that resolves users from an in-process cache.
+
+simplejwt's JWTAuthentication loads the user row on every request. Here
+users are kept in a small LRU cache for ``AUTH_USER_CACHE_SECONDS``. A
+User save or delete in this process evicts the entry (rest.signals), and
+the TTL bounds how long other processes keep serving the old row.
+
+With ``JWT_TRUST_ROLE_CLAIMS`` on, access tokens also carry the user's
+role and staff flags (see RoleTokenObtainPairSerializer), and requests
+presenting them are authenticated without touching the cache or the
+database. A role change then takes effect when the token is next
+refreshed.
+"""
+import time
+from collections import OrderedDict
+from copy import copy
+from threading import Lock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+ROLE_CLAIMS = ('username', 'role', 'is_staff', 'is_superuser')
+
+
+class UserCache:
+    """Least-recently-used users by id, each kept for ``AUTH_USER_CACHE_SECONDS``.
+
+    Ids are keyed as strings, the form they take in token claims.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user):
+        ttl = getattr(settings, 'AUTH_USER_CACHE_SECONDS', 60)
+        size = getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000)
+        user_id = str(user_id)
+        with self._lock:
+            self._entries[user_id] = (user, time.monotonic() + ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+def add_role_claims(token, user):
+    for claim in ROLE_CLAIMS:
+        token[claim] = getattr(user, claim)
+
+
+def user_from_claims(token):
+    """An unsaved User built from a token's role claims, or None when it has none.
+
+    It is never read from the database, so it must not be saved.
+    """
+    if not getattr(settings, 'JWT_TRUST_ROLE_CLAIMS', False):
+        return None
+    if any(claim not in token for claim in ROLE_CLAIMS):
+        return None
+    return get_user_model()(
+        **{api_settings.USER_ID_FIELD: token[api_settings.USER_ID_CLAIM]},
+        **{claim: token[claim] for claim in ROLE_CLAIMS},
+        is_active=True,
+    )
+
+
+def _user_id(token):
+    try:
+        return token[api_settings.USER_ID_CLAIM]
+    except KeyError as exc:
+        raise InvalidToken("Token contained no recognizable user identification") from exc
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        user = user_from_claims(validated_token)
+        if user is not None:
+            return user
+        user_id = _user_id(validated_token)
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        # A copy, so a view changing request.user can't leak into other requests
+        return copy(user)
+
+    async def aget_user(self, validated_token):
+        """get_user for async views, with an async query on a cache miss."""
+        user = user_from_claims(validated_token)
+        if user is not None:
+            return user
+        user_id = _user_id(validated_token)
+        user = user_cache.get(user_id)
+        if user is None:
+            user = await self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+            if user is None:
+                raise AuthenticationFailed("User not found", code='user_not_found')
+            user_cache.set(user_id, user)
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed("User is inactive", code='user_inactive')
+        return copy(user)
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Token pair whose tokens carry the role claims when they are trusted."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        if getattr(settings, 'JWT_TRUST_ROLE_CLAIMS', False):
+            add_role_claims(token, user)
+        return token
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refreshed access tokens carry the user's current role, not the one at login."""
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        if getattr(settings, 'JWT_TRUST_ROLE_CLAIMS', False):
+            access = AccessToken(data['access'], verify=False)
+            user = get_user_model().objects.get(**{api_settings.USER_ID_FIELD: _user_id(access)})
+            add_role_claims(access, user)
+            data['access'] = str(access)
+        return data
@@ -0,0 +1,165 @@
+from decimal import Decimal
+
+from django.db import transaction
+
+from .events import publish_on_commit
+from .exceptions import OutOfStock
+from .kitchen import loaded_scheduler
+from .models import Customer, Order, OrderItem, Product
+from .receipts import queue_receipts
+from .retry import retry_on_lock
+from .rollups import record_orders
+from .serializers import BatchOrderSerializer
+
+
+MAX_BATCH_SIZE = 1000
+MAX_ORDER_TOTAL = Decimal('99999.99')
+
+
+@retry_on_lock
+def create_order_batch(entries):
+    """Validate and insert many orders with their items.
+
+    Returns one result per entry, in input order. Valid entries are written
+    with two bulk_create calls inside a single transaction; invalid entries
+    are reported and skipped.
+    """
+    results = [None] * len(entries)
+    valid = []
+    for index, entry in enumerate(entries):
+        serializer = BatchOrderSerializer(data=entry)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results[index] = {'index': index, 'status': 'invalid', 'errors': serializer.errors}
+
+    product_ids = {item['product'] for _, data in valid for item in data['items']}
+    products = {
+        row[0]: row[1:]
+        for row in Product.objects.filter(id__in=product_ids).values_list(
+            'id', 'price', 'category_id', 'preparation_time', 'stock',
+        )
+    }
+
+    account_ids = {data['customer_account'] for _, data in valid if data.get('customer_account')}
+    accounts = set(Customer.objects.filter(id__in=account_ids).values_list('id', flat=True))
+
+    orders, order_items, kitchen_tasks = [], [], []
+    for index, data in valid:
+        missing = sorted({item['product'] for item in data['items']} - products.keys())
+        if missing:
+            results[index] = {
+                'index': index,
+                'status': 'invalid',
+                'errors': {'items': [f"Unknown product id {pk}" for pk in missing]},
+            }
+            continue
+        account = data.get('customer_account')
+        if account and account not in accounts:
+            results[index] = {
+                'index': index,
+                'status': 'invalid',
+                'errors': {'customer_account': [f"Unknown customer id {account}"]},
+            }
+            continue
+        total = sum(products[item['product']][0] * item['quantity'] for item in data['items'])
+        if total > MAX_ORDER_TOTAL:
+            results[index] = {
+                'index': index,
+                'status': 'invalid',
+                'errors': {'total_amount': [f"Order total exceeds {MAX_ORDER_TOTAL}"]},
+            }
+            continue
+        order = Order(
+            customer=data['customer'],
+            customer_account_id=account,
+            status=data['status'],
+            notess=data.get('notess'),
+            total_amount=total,
+        )
+        orders.append((index, order, data['items']))
+
+    with transaction.atomic():
+        orders = [entry for entry in orders if _reserve(entry, products, results)]
+        Order.objects.bulk_create([order for _, order, _ in orders])
+        for _, order, items in orders:
+            order._loaded_status = order.status
+            rows = [
+                OrderItem(
+                    order_id=order.pk, product_id=item['product'], quantity=item['quantity'],
+                    unit_price=products[item['product']][0],
+                )
+                for item in items
+            ]
+            order_items.extend(rows)
+            if order.status == 'pending':
+                kitchen_tasks.append((order, rows))
+        OrderItem.objects.bulk_create(order_items)
+        record_orders(
+            [order for _, order, _ in orders],
+            {order.pk: _lines(items, products) for _, order, items in orders},
+        )
+        queue_receipts([
+            order for _, order, _ in orders if order.status == 'completed' and order.customer_account_id
+        ])
+        transaction.on_commit(lambda: _schedule(kitchen_tasks, products))
+        for _, order, _ in orders:
+            publish_on_commit('created', order=order)
+
+    for index, order, _ in orders:
+        results[index] = {
+            'index': index,
+            'status': 'created',
+            'id': order.pk,
+            'total_amount': str(order.total_amount),
+        }
+    return results
+
+
+def _reserve(entry, products, results):
+    """Reserve stock for one order's tracked products, all or nothing."""
+    index, order, items = entry
+    if order.status == 'canceled':
+        return True
+    demand = {}
+    for item in items:
+        if products[item['product']][3] is not None:
+            demand[item['product']] = demand.get(item['product'], 0) + item['quantity']
+    if not demand:
+        return True
+    try:
+        with transaction.atomic():
+            for product_id, quantity in demand.items():
+                if Product.objects.filter(pk=product_id).reserve(quantity) == 0:
+                    raise OutOfStock()
+    except OutOfStock as exc:
+        results[index] = {'index': index, 'status': 'invalid', 'errors': {'items': [exc.detail]}}
+        return False
+    return True
+
+
+def _lines(items, products):
+    """Per-product units and revenue for one order, shaped like rollups.order_lines()."""
+    lines = {}
+    for item in items:
+        price, category_id = products[item['product']][:2]
+        line = lines.setdefault(item['product'], {
+            'product_id': item['product'],
+            'product__category_id': category_id,
+            'units': 0,
+            'revenue': Decimal('0'),
+        })
+        line['units'] += item['quantity']
+        line['revenue'] += price * item['quantity']
+    return list(lines.values())
+
+
+def _schedule(kitchen_tasks, products):
+    scheduler = loaded_scheduler()
+    if scheduler is None:
+        return
+    for order, rows in kitchen_tasks:
+        scheduler.add_order(
+            order.pk, order.order_date,
+            [(row.pk, products[row.product_id][2]) for row in rows],
+        )
@@ -0,0 +1,620 @@
+"""Micro-benchmarks run by ``python manage.py benchmark``.
+
+Each suite is a function registered with ``@suite`` that returns a dict of
+measurements; the command prints them and can save them as JSON so runs
+can be compared across commits. Suites registered with ``database=True``
+run against a scratch test database the command creates and destroys.
+"""
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+
+SUITES = {}
+
+
+def suite(name, database=False):
+    def register(func):
+        func.needs_database = database
+        SUITES[name] = func
+        return func
+    return register
+
+
+def measure(func, repeat, setup=None):
+    """Call func ``repeat`` times and summarise the latencies in microseconds.
+
+    ``setup`` runs before every call, outside the timed region.
+    """
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return {
+        'runs': repeat,
+        'throughput_per_s': round(repeat / (sum(samples) / 1e6), 1) if sum(samples) else None,
+        'mean_us': round(statistics.fmean(samples), 2),
+        'p50_us': round(samples[len(samples) // 2], 2),
+        'p99_us': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 2),
+    }
+
+
+@suite('kitchen')
+def kitchen_suite(scale=1):
+    """Incremental scheduler updates against a queue of a few thousand open tasks."""
+    from .kitchen import KitchenScheduler
+
+    rng = random.Random(42)
+    now = datetime(2025, 1, 1, 18, tzinfo=dt_timezone.utc)
+    scheduler = KitchenScheduler(stations=6, now=now.timestamp())
+    orders = {}
+
+    def add(order_id, task_count):
+        order_date = now + timedelta(seconds=order_id * 5)
+        items = [(order_id * 10 + n, rng.randint(2, 25)) for n in range(task_count)]
+        orders[order_id] = (order_date, items)
+        scheduler.add_order(order_id, order_date, items)
+
+    for order_id in range(1000 * scale):
+        add(order_id, rng.randint(1, 5))
+
+    def arrive():
+        add(len(orders), 3)
+
+    def cancel_recent():
+        order_id = len(orders) - 1 - rng.randint(0, 20)
+        scheduler.remove_order(order_id)
+        scheduler.add_order(order_id, *orders[order_id])
+
+    def cancel_oldest():
+        # Drops nearly the whole plan; the next read replays it
+        order_id = rng.randint(0, 20)
+        scheduler.remove_order(order_id)
+        scheduler.add_order(order_id, *orders[order_id])
+
+    def cancel_oldest_then_eta_newest():
+        cancel_oldest()
+        scheduler.estimated_ready_at(len(orders) - 1)
+
+    def eta_lookup():
+        scheduler.estimated_ready_at(rng.randrange(len(orders)))
+
+    return {
+        'open_tasks': len(scheduler),
+        'arrival': measure(arrive, 500),
+        'cancel_and_readd_recent': measure(cancel_recent, 200),
+        'cancel_and_readd_oldest': measure(cancel_oldest, 200),
+        'cancel_oldest_then_eta_newest': measure(cancel_oldest_then_eta_newest, 200),
+        'eta_lookup': measure(eta_lookup, 1000),
+    }
+
+
+def seed_products(count, categories=20):
+    """Seed ``categories`` categories and ``count`` products spread across them."""
+    from .models import Category, Product
+
+    created = Category.objects.bulk_create([
+        Category(name=f"Category {i}", description="Seeded") for i in range(categories)
+    ])
+    Product.objects.bulk_create(
+        [
+            Product(
+                name=f"Product {i}",
+                description=f"Seeded product {i}",
+                price=Decimal(i % 50) + Decimal('0.99'),
+                category=created[i % categories],
+                is_available=i % 7 != 0,
+                preparation_time=5 + i % 20,
+            )
+            for i in range(count)
+        ],
+        batch_size=500,
+    )
+    return created
+
+
+@suite('serializers', database=True)
+def serializers_suite(scale=1):
+    """Per-row cost of rendering the product list: ModelSerializer vs the values() fast path."""
+    from .fast_serializers import fast_product_serializer
+    from .models import Product
+    from .serializers import ProductSerializer
+
+    count = 10000 * scale
+    seed_products(count)
+    queryset = Product.objects.all()
+
+    def per_row(result):
+        return dict(result, per_row_us=round(result['p50_us'] / count, 3))
+
+    return {
+        'rows': count,
+        'model_serializer': per_row(measure(lambda: ProductSerializer(queryset.all(), many=True).data, 3)),
+        'model_serializer_select_related': per_row(measure(
+            lambda: ProductSerializer(queryset.select_related('category'), many=True).data, 3,
+        )),
+        'values_serializer': per_row(measure(
+            lambda: fast_product_serializer.many(fast_product_serializer.values(queryset.all())), 3,
+        )),
+    }
+
+
+def bulk_insert(model, fields, rows):
+    """INSERT rows with executemany, skipping model instances and signals.
+
+    Values go through each field's get_db_prep_save(), so dates and
+    decimals are adapted the same way the ORM would for this backend.
+    """
+    from django.db import connection
+
+    columns = [model._meta.get_field(name) for name in fields]
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(field.column) for field in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(value, connection) for field, value in zip(columns, row)]
+            for row in rows
+        ])
+
+
+def seed_orders(count, products=None, customers=500, chunk_size=10000, seed=42, accounts=None):
+    """Seed ``count`` orders spread over the last year, in chunks of ``chunk_size``.
+
+    ``products`` is a list of (id, price); when given every order gets 1-4
+    items and a matching total. ``accounts`` is a list of (customer id,
+    username); when given orders are spread over those accounts instead of
+    ``customers`` walk-in names. Ids are assigned here rather than read
+    back, so millions of rows go in at executemany speed.
+    """
+    from django.db import transaction
+    from django.db.models import Max
+
+    from .models import Order, OrderItem
+
+    rng = random.Random(seed)
+    now = datetime.now(dt_timezone.utc)
+    next_order = (Order.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    next_item = (OrderItem.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+    for start in range(0, count, chunk_size):
+        orders, items = [], []
+        for i in range(start, min(start + chunk_size, count)):
+            total = Decimal(i % 200) + Decimal('0.50')
+            if products:
+                total = Decimal('0')
+                for _ in range(rng.randint(1, 4)):
+                    product_id, price = rng.choice(products)
+                    quantity = rng.randint(1, 3)
+                    items.append((next_item, next_order, product_id, quantity, price))
+                    total += price * quantity
+                    next_item += 1
+            if accounts:
+                account, name = accounts[i % len(accounts)]
+            else:
+                account, name = None, f"Customer {i % customers}"
+            orders.append((
+                next_order,
+                name,
+                account,
+                now - timedelta(seconds=(count - i) * 31536000 // count),
+                total,
+                ('pending', 'completed', 'canceled')[i % 3],
+                "Seeded" if i % 4 == 0 else None,
+            ))
+            next_order += 1
+        with transaction.atomic():
+            bulk_insert(Order, [
+                'id', 'customer', 'customer_account', 'order_date', 'total_amount', 'status', 'notess',
+            ], orders)
+            bulk_insert(OrderItem, ['id', 'order', 'product', 'quantity', 'unit_price'], items)
+
+
+@suite('renderers', database=True)
+def renderers_suite(scale=1):
+    """Render the menu and an order list page with each available renderer."""
+    from rest_framework.renderers import JSONRenderer
+
+    from .fast_serializers import fast_order_serializer
+    from .menu import menu_engine
+    from .models import Order
+    from .renderers import FastJSONRenderer, MessagePackRenderer, msgpack, orjson
+
+    seed_products(2000 * scale)
+    seed_orders(1000 * scale)
+    payloads = {
+        'menu': menu_engine.build(),
+        'orders': fast_order_serializer.many(fast_order_serializer.values(Order.objects.all())),
+    }
+    renderers = {'drf_json': JSONRenderer()}
+    if orjson is not None:
+        renderers['fast_json'] = FastJSONRenderer()
+    if msgpack is not None:
+        renderers['msgpack'] = MessagePackRenderer()
+
+    results = {}
+    for payload_name, payload in payloads.items():
+        for renderer_name, renderer in renderers.items():
+            result = measure(lambda: renderer.render(payload), 20)
+            result['bytes'] = len(renderer.render(payload))
+            results[f'{payload_name}.{renderer_name}'] = result
+    return results
+
+
+def seed_customers(count):
+    """Seed ``count`` users, each with a Customer profile."""
+    from django.contrib.auth import get_user_model
+
+    from .models import Customer
+
+    User = get_user_model()
+    User.objects.bulk_create(
+        [User(username=f"bench-customer-{i}") for i in range(count)],
+        batch_size=500,
+    )
+    users = User.objects.filter(username__startswith='bench-customer-')
+    return Customer.objects.bulk_create(
+        [Customer(user=user, phone=f"555{i:07d}", address="Seeded") for i, user in enumerate(users)],
+        batch_size=500,
+    )
+
+
+@suite('api', database=True)
+def api_suite(scale=1, categories=50, products=2000, orders=20000, customers=200, repeat=50):
+    """Latency and throughput of the real endpoints through the full request stack.
+
+    Requests go through the Django test client, so middleware,
+    authentication, filtering, pagination and rendering are all included.
+    Product and order volumes are multiplied by ``scale``.
+    """
+    from django.contrib.auth import get_user_model
+    from django.core.cache import cache
+    from django.db import connection
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    from .catalog import bump_catalog_version
+    from .models import Order, OrderItem, Product
+    from .search import get_search_backend
+
+    cache.clear()
+    seed_products(products * scale, categories=categories)
+    get_search_backend().rebuild()
+    product_rows = list(Product.objects.values_list('id', 'price'))
+    seeded_customers = seed_customers(customers)
+    seed_orders(
+        orders * scale, products=product_rows,
+        accounts=[(customer.pk, customer.user.username) for customer in seeded_customers],
+    )
+
+    client = APIClient()
+    client.raise_request_exception = False
+    client.force_authenticate(user=get_user_model().objects.create_user(
+        username='bench-staff', password='bench', is_staff=True,
+    ))
+    rng = random.Random(7)
+    results = {}
+
+    def endpoint(name, call, expected=200, setup=None, runs=repeat):
+        # One untimed call to warm caches, check the status and count queries
+        if setup is not None:
+            setup()
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            response = call()
+        if response.status_code != expected:
+            results[name] = {'error': f"HTTP {response.status_code}"}
+            return
+        result = measure(call, runs, setup=setup)
+        result['queries'] = len(queries)
+        result['bytes'] = len(response.content)
+        results[name] = result
+
+    products_url = reverse('product-list')
+    price_filter = {'price_gte': 10, 'price_lt': 20}
+    endpoint('products.list', lambda: client.get(products_url))
+    endpoint('products.list_price_filter', lambda: client.get(products_url, price_filter))
+    endpoint('products.list_price_filter_cursor', lambda: client.get(products_url, {**price_filter, 'cursor': ''}))
+    endpoint('products.available', lambda: client.get(reverse('product-available-products')))
+    search_url = reverse('product-search')
+    endpoint('products.search', lambda: client.get(search_url, {'q': f"product {rng.randint(1, 99)}"}))
+
+    menu_url = reverse('product-menu-by-category')
+    endpoint('menu.cold', lambda: client.get(menu_url), setup=bump_catalog_version)
+    endpoint('menu.warm', lambda: client.get(menu_url))
+    etag = client.get(menu_url)['ETag']
+    endpoint('menu.not_modified', lambda: client.get(menu_url, HTTP_IF_NONE_MATCH=etag), expected=304)
+
+    orders_url = reverse('order-list')
+    endpoint('orders.list_cursor', lambda: client.get(orders_url, {'cursor': ''}))
+    endpoint('orders.create', lambda: client.post(
+        orders_url, {'customer': "Customer 1", 'status': 'pending'}, format='json',
+    ), expected=201)
+    pending = list(Order.objects.filter(status='pending').values_list('id', flat=True)[:repeat + 1])
+    endpoint('orders.complete', lambda: client.patch(
+        reverse('order-detail', args=[pending.pop()]), {'status': 'completed'}, format='json',
+    ))
+
+    customer_ids = [customer.pk for customer in seeded_customers]
+    endpoint('customers.list', lambda: client.get(reverse('customer-list')))
+    endpoint('customers.orders', lambda: client.get(
+        reverse('customer-orders', args=[rng.choice(customer_ids)]),
+    ))
+
+    return {
+        'volumes': {
+            'categories': categories,
+            'products': products * scale,
+            'orders': orders * scale,
+            'order_items': OrderItem.objects.count(),
+            'customers': customers,
+        },
+        'endpoints': results,
+    }
+
+
+@suite('asgi', database=True)
+def asgi_suite(scale=1, clients=2000, polls=3, workers=16, products=500, db_latency_ms=0):
+    """Idle-polling clients against the DRF views on WSGI workers vs the async views on ASGI.
+
+    ``clients`` tablets poll the menu with If-None-Match at the same time,
+    ``polls`` times each. On the WSGI side the requests queue for a pool of
+    ``workers`` threads, like a threaded WSGI server; on the ASGI side each
+    client awaits the async view directly. Latency is measured from when a
+    client sends a request, so it includes time spent queued for a worker.
+
+    The scratch SQLite database answers in microseconds; ``db_latency_ms``
+    adds a simulated network round-trip to every request, held by the
+    worker thread on WSGI and awaited on ASGI, to model a remote database.
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.contrib.auth import get_user_model
+    from django.core.cache import cache
+    from django.db import connections
+    from django.test import AsyncClient, Client
+    from django.urls import reverse
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    cache.clear()
+    seed_products(products * scale)
+    user = get_user_model().objects.create_user(username='bench-tablet', password='bench')
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+
+    wsgi_url = reverse('product-menu-by-category')
+    asgi_url = reverse('async-menu-by-category')
+    wsgi_etag = Client().get(wsgi_url, **headers)['ETag']
+    asgi_etag = Client().get(asgi_url, **headers)['ETag']
+
+    async def run(send):
+        samples = []
+        statuses = {}
+
+        async def tablet():
+            for _ in range(polls):
+                started = time.perf_counter()
+                response = await send()
+                samples.append((time.perf_counter() - started) * 1e6)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(tablet() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+        samples.sort()
+        return {
+            'requests': len(samples),
+            'statuses': statuses,
+            'seconds': round(elapsed, 3),
+            'throughput_per_s': round(len(samples) / elapsed, 1),
+            'p50_us': round(samples[len(samples) // 2], 2),
+            'p99_us': round(samples[int(len(samples) * 0.99)], 2),
+        }
+
+    def wsgi_poll():
+        response = Client().get(wsgi_url, HTTP_IF_NONE_MATCH=wsgi_etag, **headers)
+        time.sleep(db_latency_ms / 1000)
+        return response
+
+    def close_connections():
+        connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        async def wsgi_send():
+            return await asyncio.get_running_loop().run_in_executor(pool, wsgi_poll)
+
+        wsgi = asyncio.run(run(wsgi_send))
+        for _ in range(workers):
+            pool.submit(close_connections)
+
+    asgi_client = AsyncClient()
+
+    async def asgi_send():
+        response = await asgi_client.get(asgi_url, headers={
+            'Authorization': headers['HTTP_AUTHORIZATION'],
+            'If-None-Match': asgi_etag,
+        })
+        await asyncio.sleep(db_latency_ms / 1000)
+        return response
+
+    asgi = asyncio.run(run(asgi_send))
+    return {
+        'clients': clients,
+        'polls_per_client': polls,
+        'wsgi_workers': workers,
+        'db_latency_ms': db_latency_ms,
+        'wsgi': wsgi,
+        'asgi': asgi,
+    }
+
+
+@suite('availability', database=True)
+def availability_suite(scale=1, products=2000, repeat=30):
+    """Cart validation: one batch availability request vs one request per line item."""
+    from django.contrib.auth import get_user_model
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    from .models import Product
+
+    seed_products(products * scale)
+    ids = list(Product.objects.values_list('id', flat=True))
+    client = APIClient()
+    client.force_authenticate(user=get_user_model().objects.create_user(username='bench-cart', password='bench'))
+    rng = random.Random(11)
+    batch_url = reverse('product-batch-availability')
+
+    results = {}
+    for size in (1, 15, 100, 500):
+        cart = rng.sample(ids, size)
+        response = client.post(batch_url, {'ids': cart}, format='json')
+        batch = measure(lambda: client.post(batch_url, {'ids': cart}, format='json'), repeat)
+        batch['bytes'] = len(response.content)
+        results[f'batch.{size}'] = batch
+        if size <= 100:
+            single = measure(
+                lambda: [client.get(reverse('product-check-availability', args=[pk])) for pk in cart],
+                max(1, repeat // 10),
+            )
+            single['requests'] = size
+            results[f'per_item.{size}'] = single
+    return results
+
+
+@suite('search', database=True)
+def search_suite(scale=1, products=2000, repeat=30):
+    """Product search: the FTS5 index vs LIKE scans, bare and combined with filters."""
+    from .models import Product
+    from .search import LikeBackend, SQLiteFTSBackend
+
+    seed_products(products * scale)
+    fts = SQLiteFTSBackend()
+    started = time.perf_counter()
+    fts.rebuild()
+    results = {'rebuild': {'seconds': round(time.perf_counter() - started, 3)}}
+
+    backends = {'fts': fts, 'like': LikeBackend()}
+    queries = {
+        'word': ("seeded", {}),
+        'prefix': ("produ 12", {}),
+        'filtered': ("product 1", {'is_available': True, 'price__lt': 20}),
+    }
+    for query_name, (query, filters) in queries.items():
+        for backend_name, backend in backends.items():
+            def page():
+                return list(backend.search(Product.objects.filter(**filters), query).values('id', 'name')[:10])
+            result = measure(page, repeat)
+            result['matches'] = backend.search(Product.objects.filter(**filters), query).count()
+            results[f'{query_name}.{backend_name}'] = result
+    return results
+
+
+@suite('writes')
+def writes_suite(scale=1, workers=8, orders=400):
+    """Concurrent order writes on a file database: stock SQLite settings vs the tuned ones.
+
+    ``workers`` threads create ``orders`` orders (times ``scale``) between
+    them, each with one line on a stock-tracked product, while two reader
+    threads page through the order list. ``stock`` runs with SQLite's
+    defaults (rollback journal, deferred transactions, no lock retries);
+    ``tuned`` with the configured pragmas, immediate transactions and
+    retries. Errors are writes that still failed, grouped by message.
+    """
+    import shutil
+    import tempfile
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from pathlib import Path
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import DEFAULT_DB_ALIAS, connections
+    from django.test import override_settings
+
+    from .models import Category, Order, OrderItem, Product
+
+    configs = {
+        'stock': ({}, 0),
+        'tuned': (settings.DATABASES[DEFAULT_DB_ALIAS].get('OPTIONS', {}), settings.DATABASE_LOCK_RETRIES),
+    }
+    count = orders * scale
+    original = connections.settings[DEFAULT_DB_ALIAS]
+    directory = Path(tempfile.mkdtemp())
+    results = {'workers': workers, 'orders': count}
+    try:
+        for name, (options, retries) in configs.items():
+            connections.close_all()
+            del connections[DEFAULT_DB_ALIAS]
+            connections.settings[DEFAULT_DB_ALIAS] = {
+                **original, 'NAME': str(directory / f'{name}.sqlite3'), 'OPTIONS': options,
+            }
+            call_command('migrate', verbosity=0, interactive=False)
+            product = Product.objects.create(
+                name="Bench", price=Decimal('4.50'), category=Category.objects.create(name="Bench"),
+                stock=count * 2,
+            )
+            connections.close_all()
+
+            errors = {}
+            done = threading.Event()
+            reads = []
+
+            def write(offset):
+                for index in range(offset, count, workers):
+                    try:
+                        order = Order.objects.create(customer=f"Table {index % 40}", status='pending')
+                        OrderItem.objects.create(order=order, product=product, quantity=1)
+                    except Exception as exc:
+                        message = str(exc)
+                        errors[message] = errors.get(message, 0) + 1
+                connections.close_all()
+
+            def read():
+                pages = 0
+                while not done.is_set():
+                    list(Order.objects.values('id', 'status', 'total_amount')[:20])
+                    pages += 1
+                reads.append(pages)
+                connections.close_all()
+
+            with override_settings(DATABASE_LOCK_RETRIES=retries):
+                readers = [threading.Thread(target=read) for _ in range(2)]
+                for reader in readers:
+                    reader.start()
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    list(pool.map(write, range(workers)))
+                elapsed = time.perf_counter() - started
+                done.set()
+                for reader in readers:
+                    reader.join()
+
+            created = Order.objects.count()
+            results[name] = {
+                'seconds': round(elapsed, 3),
+                'orders_per_s': round(created / elapsed, 1),
+                'created': created,
+                'errors': errors,
+                'reader_pages_per_s': round(sum(reads) / elapsed, 1),
+            }
+            connections.close_all()
+    finally:
+        connections.close_all()
+        del connections[DEFAULT_DB_ALIAS]
+        connections.settings[DEFAULT_DB_ALIAS] = original
+        shutil.rmtree(directory)
+    return results
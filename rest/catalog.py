@@ -0,0 +1,86 @@
+"""Catalog version and modification time, kept in the default cache.
+
+They back the menu cache (rest.menu) and the catalog ETag/Last-Modified
+validators (rest.conditional), so the cache must be shared by every
+worker process: with a per-process LocMemCache a catalog write in one
+worker never reaches the others, which keep serving the old menu and
+answering 304 to stale ETags. settings.CACHES uses Redis when
+``CACHE_URL`` is set, and ``check --deploy`` warns while it isn't.
+
+A version is a random token rather than a counter, so two processes
+bumping at once, or a cache that lost the key, can never hand the same
+version to different catalog contents.
+"""
+import secrets
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_MODIFIED_KEY = 'catalog:modified'
+
+
+def get_catalog_version():
+    """Current catalog version, replaced on every Category/Product write."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = _new_version()
+        cache.add(CATALOG_VERSION_KEY, version, None)
+        version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def get_catalog_modified():
+    """Unix time of the last catalog write.
+
+    If the cache lost it, assume the catalog just changed: clients refetch
+    once instead of the product table being scanned for max(updated_at).
+    """
+    modified = cache.get(CATALOG_MODIFIED_KEY)
+    if modified is None:
+        cache.add(CATALOG_MODIFIED_KEY, int(time.time()), None)
+        modified = cache.get(CATALOG_MODIFIED_KEY, int(time.time()))
+    return modified
+
+
+async def aget_catalog_version():
+    """Async get_catalog_version() for async views."""
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        version = _new_version()
+        await cache.aadd(CATALOG_VERSION_KEY, version, None)
+        version = await cache.aget(CATALOG_VERSION_KEY, version)
+    return version
+
+
+async def aget_catalog_modified():
+    """Async get_catalog_modified() for async views."""
+    modified = await cache.aget(CATALOG_MODIFIED_KEY)
+    if modified is None:
+        await cache.aadd(CATALOG_MODIFIED_KEY, int(time.time()), None)
+        modified = await cache.aget(CATALOG_MODIFIED_KEY, int(time.time()))
+    return modified
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog rendering by moving to a new version.
+
+    The version moves right away and again once the surrounding transaction
+    commits, so a reader that rendered the old rows in between can't keep
+    them cached under the new version.
+    """
+    version = _bump()
+    transaction.on_commit(_bump)
+    return version
+
+
+def _bump():
+    version = _new_version()
+    cache.set_many({CATALOG_MODIFIED_KEY: int(time.time()), CATALOG_VERSION_KEY: version}, None)
+    return version
+
+
+def _new_version():
+    return secrets.token_hex(6)
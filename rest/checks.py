@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """The catalog version and menu cache need a cache every worker process shares."""
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend != 'django.core.cache.backends.locmem.LocMemCache':
+        return []
+    return [Warning(
+        "The default cache is a per-process LocMemCache.",
+        hint=(
+            "Catalog writes in one worker won't invalidate the menu or catalog "
+            "ETags served by the others. Set CACHE_URL to a shared Redis cache "
+            "unless a single process serves the API."
+        ),
+        id='rest.W001',
+    )]
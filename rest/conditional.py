@@ -0,0 +1,72 @@
+from functools import wraps
+from hashlib import md5
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .catalog import aget_catalog_modified, aget_catalog_version, get_catalog_modified, get_catalog_version
+
+
+def catalog_validators(request):
+    """ETag and Last-Modified for a catalog read, without touching the database.
+
+    Every Category/Product write (including stock reservations that flip
+    ``is_available``) bumps the catalog version and stamps the modification
+    time, the same moment the row's ``updated_at`` moves. The ETag ties
+    that version to the exact representation asked for: path, query string
+    (filters, pages, cursors) and negotiated media type.
+    """
+    return _etag(get_catalog_version(), request), get_catalog_modified()
+
+
+async def acatalog_validators(request):
+    """Async catalog_validators(), for async views."""
+    return _etag(await aget_catalog_version(), request), await aget_catalog_modified()
+
+
+def _etag(version, request):
+    representation = '|'.join((
+        request.get_full_path(),
+        getattr(request, 'accepted_media_type', '') or '',
+    ))
+    digest = md5(representation.encode(), usedforsecurity=False).hexdigest()[:16]
+    return quote_etag(f'{version}-{digest}')
+
+
+def catalog_conditional(view_method):
+    """Answer catalog GETs with 304 Not Modified while the catalog is unchanged.
+
+    The check runs after authentication and content negotiation but before
+    the handler, so a matching If-None-Match or If-Modified-Since costs no
+    queries and no serialization.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        etag, last_modified = catalog_validators(request)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view_method(self, request, *args, **kwargs)
+        return _add_validators(response, etag, last_modified)
+    return wrapper
+
+
+def async_catalog_conditional(view):
+    """catalog_conditional for async function views."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        etag, last_modified = await acatalog_validators(request)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await view(request, *args, **kwargs)
+        return _add_validators(response, etag, last_modified)
+    return wrapper
+
+
+def _add_validators(response, etag, last_modified):
+    if not 200 <= response.status_code < 300 and response.status_code != 304:
+        return response
+    response.setdefault('ETag', etag)
+    response.setdefault('Last-Modified', http_date(last_modified))
+    # Tablets may keep the body but have to revalidate before using it
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
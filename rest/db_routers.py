@@ -0,0 +1,127 @@
+"""Primary/replica database routing.
+
+Reads made while serving a safe (GET/HEAD/OPTIONS) request go to one of
+the ``DATABASE_READ_REPLICAS`` aliases; everything else, and anything run
+outside a request (management commands, the kitchen worker), uses the
+primary. Two rules keep a client reading its own writes despite
+replication lag:
+
+- once a request writes, its remaining reads use the primary;
+- a request that wrote pins its client to the primary for
+  ``DATABASE_REPLICA_PIN_SECONDS``. Browsers are pinned by a short-lived
+  cookie. The response also carries a ``DB-Pin`` header holding the pin's
+  expiry (Unix time); clients without a cookie jar (JWT apps, the POS)
+  send it back as a ``DB-Pin`` request header until then. A client that
+  does neither may read a replica that hasn't caught up with its write.
+
+With no replicas configured every query goes to the primary.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'db_pin'
+PIN_HEADER = 'DB-Pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingState:
+    """Where the current request reads from."""
+
+    def __init__(self, replica_reads):
+        self.replica_reads = replica_reads
+        self.replica = None
+        self.wrote = False
+
+    def read_alias(self):
+        if not self.replica_reads or self.wrote:
+            return DEFAULT_DB_ALIAS
+        if self.replica is None:
+            replicas = getattr(settings, 'DATABASE_READ_REPLICAS', ())
+            # One replica per request, so its reads see a single snapshot
+            self.replica = random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+        return self.replica
+
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        return DEFAULT_DB_ALIAS if state is None else state.read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the primary's data, so objects read from either relate
+        pool = {DEFAULT_DB_ALIAS, *getattr(settings, 'DATABASE_READ_REPLICAS', ())}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        if db in getattr(settings, 'DATABASE_READ_REPLICAS', ()):
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Set up the routing state for each request and pin writers to the primary."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state, token = self._enter(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._exit(request, state, response)
+
+    async def __acall__(self, request):
+        state, token = self._enter(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._exit(request, state, response)
+
+    def _enter(self, request):
+        state = RoutingState(request.method in SAFE_METHODS and not self._pinned(request))
+        return state, _state.set(state)
+
+    def _pinned(self, request):
+        if PIN_COOKIE in request.COOKIES:
+            return True
+        try:
+            return float(request.headers.get(PIN_HEADER, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _exit(self, request, state, response):
+        if state.wrote or request.method not in SAFE_METHODS:
+            seconds = getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 15)
+            response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+            response[PIN_HEADER] = str(int(time.time() + seconds))
+        return response
@@ -0,0 +1,164 @@
+"""Order change events, fanned out to live subscribers (the SSE stream).
+
+Events are published after the writing transaction commits:
+
+- ``created``: a new order
+- ``status_changed``: carries ``old_status``
+- ``total_changed``: carries ``delta``
+
+Each event carries a snapshot of the order. The broker is pluggable via
+``ORDER_EVENTS_BROKER``. The default InMemoryBroker only reaches
+subscribers in the same process, which suits a single ASGI worker and
+tests; a multi-worker deployment plugs in a broker backed by a shared
+pub/sub with the same interface.
+"""
+import asyncio
+import itertools
+from collections import deque
+from threading import Lock
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class Broker:
+    """Interface of an order events broker."""
+
+    def publish(self, event):
+        """Deliver ``event`` (a dict) to every subscriber. Safe to call from any thread."""
+        raise NotImplementedError
+
+    def subscribe(self, last_event_id=None):
+        """A Subscription, starting after ``last_event_id`` when the broker can replay."""
+        raise NotImplementedError
+
+    def has_subscribers(self):
+        return True
+
+
+class Subscription:
+    """Async iterator over the events published after it was created.
+
+    Events are queued on the subscriber's event loop. A consumer that falls
+    more than ``max_pending`` events behind loses the oldest ones rather
+    than holding memory for a dead connection.
+    """
+
+    def __init__(self, broker, max_pending=1000):
+        self.broker = broker
+        self.loop = asyncio.get_running_loop()
+        self.queue = deque(maxlen=max_pending)
+        self.ready = asyncio.Event()
+
+    def push(self, event):
+        # Runs on self.loop
+        self.queue.append(event)
+        self.ready.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.queue:
+            self.ready.clear()
+            await self.ready.wait()
+        return self.queue.popleft()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker(Broker):
+    """Process-local broker keeping the last ``history`` events for reconnects."""
+
+    def __init__(self, history=1000):
+        self._lock = Lock()
+        self._ids = itertools.count(1)
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+
+    def publish(self, event):
+        with self._lock:
+            event = {**event, 'id': next(self._ids)}
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, event)
+            except RuntimeError:
+                # The subscriber's loop is gone
+                self.unsubscribe(subscription)
+        return event
+
+    def subscribe(self, last_event_id=None):
+        subscription = Subscription(self)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._history:
+                    if event['id'] > last_event_id:
+                        subscription.push(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+
+_broker = None
+_broker_lock = Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            path = getattr(settings, 'ORDER_EVENTS_BROKER', 'rest.events.InMemoryBroker')
+            _broker = import_string(path)()
+        return _broker
+
+
+def reset_broker():
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def order_snapshot(order):
+    return {
+        'id': order.pk,
+        'customer': order.customer,
+        'customer_account': order.customer_account_id,
+        'status': order.status,
+        'total_amount': str(order.total_amount),
+        'order_date': order.order_date.isoformat() if order.order_date else None,
+    }
+
+
+def publish_on_commit(event_type, order=None, order_id=None, **extra):
+    """Publish an order event once the current transaction commits.
+
+    When only ``order_id`` is known (totals moved with an F() update) the
+    order is read back at publish time, and only if anyone is listening.
+    """
+    snapshot = order_snapshot(order) if order is not None else None
+
+    def publish():
+        broker = get_broker()
+        event_order = snapshot
+        if event_order is None:
+            from .models import Order
+
+            if not broker.has_subscribers():
+                return
+            current = Order.objects.filter(pk=order_id).first()
+            if current is None:
+                return
+            event_order = order_snapshot(current)
+        broker.publish({'type': event_type, 'order': event_order, **extra})
+
+    transaction.on_commit(publish)
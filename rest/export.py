@@ -0,0 +1,98 @@
+import csv
+import json
+from itertools import groupby
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import OrderItem
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+ORDER_FIELDS = ['id', 'order_date', 'customer', 'status', 'total_amount', 'notess']
+ITEM_FIELDS = ['product_id', 'product__name', 'unit_price', 'quantity']
+
+CSV_HEADER = [
+    'order_id', 'order_date', 'customer', 'status', 'total_amount', 'notes',
+    'product_id', 'product_name', 'unit_price', 'quantity', 'line_total',
+]
+
+
+class Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def iter_orders(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield order dicts with their items, walking the table in id chunks.
+
+    Each chunk costs two queries (orders, then their items joined with
+    product) and only one chunk is held in memory at a time.
+    """
+    queryset = queryset.order_by('id').values(*ORDER_FIELDS)
+    last_id = 0
+    while True:
+        orders = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not orders:
+            return
+        last_id = orders[-1]['id']
+
+        items = (
+            OrderItem.objects
+            .filter(order_id__in=[order['id'] for order in orders])
+            .order_by('order_id', 'id')
+            .values('order_id', *ITEM_FIELDS)
+        )
+        items_by_order = {
+            order_id: list(group)
+            for order_id, group in groupby(items, key=lambda item: item['order_id'])
+        }
+        for order in orders:
+            order['items'] = items_by_order.get(order['id'], [])
+            yield order
+
+
+def iter_csv(orders):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for order in orders:
+        head = [
+            order['id'], order['order_date'].isoformat(), order['customer'],
+            order['status'], order['total_amount'], order['notess'] or '',
+        ]
+        if not order['items']:
+            yield writer.writerow(head + [''] * 5)
+        for item in order['items']:
+            yield writer.writerow(head + [
+                item['product_id'], item['product__name'], item['unit_price'],
+                item['quantity'], item['unit_price'] * item['quantity'],
+            ])
+
+
+def iter_ndjson(orders):
+    for order in orders:
+        yield json.dumps({
+            'id': order['id'],
+            'order_date': order['order_date'],
+            'customer': order['customer'],
+            'status': order['status'],
+            'total_amount': order['total_amount'],
+            'notes': order['notess'],
+            'items': [
+                {
+                    'product_id': item['product_id'],
+                    'product_name': item['product__name'],
+                    'unit_price': item['unit_price'],
+                    'quantity': item['quantity'],
+                }
+                for item in order['items']
+            ],
+        }, cls=DjangoJSONEncoder) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+}
@@ -0,0 +1,111 @@
+from datetime import datetime
+
+from rest_framework import ISO_8601, serializers
+from rest_framework.fields import empty
+from rest_framework.settings import api_settings
+
+from .serializers import CategorySerializer, OrderSerializer, ProductAvailabilitySerializer, ProductSerializer
+
+
+# Field types whose to_representation() returns plain values unchanged
+PASSTHROUGH_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.IntegerField,
+)
+
+SKIP = object()
+
+
+class ValuesSerializer:
+    """Read-only fast path for a ModelSerializer, fed by ``.values()`` rows.
+
+    The readable fields of the wrapped serializer are mapped to ``values()``
+    lookups once (``category.name`` becomes ``category__name``, joined in the
+    same query), and each row is rendered with those fields' own
+    to_representation() only where it actually transforms the value, so the
+    output matches the ModelSerializer exactly without building model
+    instances or running the field machinery per row.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.columns = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if not field.source_attrs or isinstance(field, serializers.BaseSerializer):
+                raise ValueError(f"{serializer_class.__name__}.{name} can't be read from values()")
+            lookup = '__'.join(field.source_attrs)
+            if isinstance(field, serializers.PrimaryKeyRelatedField):
+                # values() already yields the related pk for a foreign key
+                convert = field.pk_field.to_representation if field.pk_field else None
+            elif isinstance(field, PASSTHROUGH_FIELDS):
+                convert = None
+            elif _is_iso_datetime(field):
+                convert = ISODateTime(field)
+            else:
+                convert = field.to_representation
+            # A null relation on a dotted source makes DRF fall back to the
+            # field default, or skip the key unless the field allows null.
+            on_null = None
+            if len(field.source_attrs) > 1 and not field.allow_null:
+                on_null = SKIP if field.default is empty else field.default
+            self.columns.append((name, lookup, convert, on_null))
+        self.lookups = [lookup for _, lookup, _, _ in self.columns]
+
+    def values(self, queryset):
+        return queryset.values(*self.lookups)
+
+    def to_representation(self, row, columns=None):
+        data = {}
+        for name, lookup, convert, on_null in columns or self.columns:
+            value = row[lookup]
+            if value is None:
+                if on_null is SKIP:
+                    continue
+                data[name] = on_null
+            else:
+                data[name] = convert(value) if convert else value
+        return data
+
+    def many(self, rows):
+        # Resolve the active timezone once per batch instead of once per value
+        columns = [
+            (name, lookup, convert.bind() if isinstance(convert, ISODateTime) else convert, on_null)
+            for name, lookup, convert, on_null in self.columns
+        ]
+        return [self.to_representation(row, columns) for row in rows]
+
+
+def _is_iso_datetime(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    return type(field) is serializers.DateTimeField and output_format.lower() == ISO_8601
+
+
+class ISODateTime:
+    """DateTimeField.to_representation for ISO output with the timezone lookup hoisted."""
+
+    def __init__(self, field, timezone=None):
+        self.field = field
+        self.timezone = timezone
+
+    def bind(self):
+        """A copy pinned to the timezone active right now."""
+        field = self.field
+        return ISODateTime(field, getattr(field, 'timezone', None) or field.default_timezone())
+
+    def __call__(self, value):
+        if self.timezone is None or not isinstance(value, datetime) or value.tzinfo is None:
+            return self.field.to_representation(value)
+        value = value.astimezone(self.timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+
+fast_product_serializer = ValuesSerializer(ProductSerializer)
+fast_category_serializer = ValuesSerializer(CategorySerializer)
+fast_order_serializer = ValuesSerializer(OrderSerializer)
+fast_availability_serializer = ValuesSerializer(ProductAvailabilitySerializer)
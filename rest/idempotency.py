@@ -0,0 +1,139 @@
+"""Idempotency keys for endpoints that create orders.
+
+A client retrying a POST sends the same ``Idempotency-Key`` header each
+time. The first request under a key runs and its response is stored with
+the key; a retry gets the stored response back, marked with an
+``Idempotent-Replayed`` header, without the view running again.
+
+The key is inserted in the same transaction as the view's writes, so they
+commit or roll back together: a request that raised leaves no key behind
+and can be retried, and a duplicate arriving while the first is still
+running waits on the key's unique index (on SQLite, on the write lock)
+and then replays the committed response. A 5xx response isn't a final
+answer: its writes are rolled back along with the key, so a retry starts
+clean. Keys are scoped to the endpoint and user and expire after
+``IDEMPOTENCY_KEY_SECONDS``; anonymous callers have nothing to scope them
+by, so their keys are refused.
+
+Lock contention is retried only at BEGIN (see rest.retry), before the
+view has run, so a retry never runs the view twice.
+"""
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .jobs import enqueue, task
+from .models import IdempotencyKey
+from .retry import retry_on_lock
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+# Seconds between this process queueing sweeps of expired keys
+PRUNE_INTERVAL = 3600
+_next_prune = 0.0
+
+
+def request_fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, separators=(',', ':'), cls=DjangoJSONEncoder)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def idempotent(view_method):
+    """Store and replay the responses of a viewset action sent with an Idempotency-Key."""
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view_method(self, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'detail': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if request.user.pk is None:
+            # One scope for every anonymous caller would replay one client's response to another
+            return Response(
+                {'detail': f'{HEADER} requires an authenticated client.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        scope = f'{self.basename}.{self.action}:{request.user.pk}'
+        return _respond_once(
+            scope, key, request_fingerprint(request),
+            lambda: view_method(self, request, *args, **kwargs),
+        )
+    return wrapper
+
+
+def _respond_once(scope, key, fingerprint, respond):
+    # Retries of a finished request are answered with a single read
+    record = IdempotencyKey.objects.filter(scope=scope, key=key, expires_at__gt=timezone.now()).first()
+    if record is not None:
+        return _replay(record, fingerprint)
+    return _respond_first(scope, key, fingerprint, respond)
+
+
+@retry_on_lock
+def _respond_first(scope, key, fingerprint, respond):
+    now = timezone.now()
+    with transaction.atomic():
+        IdempotencyKey.objects.filter(scope=scope, key=key, expires_at__lte=now).delete()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    scope=scope, key=key, fingerprint=fingerprint,
+                    expires_at=now + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_SECONDS', 86400)),
+                )
+        except IntegrityError:
+            return _replay(IdempotencyKey.objects.get(scope=scope, key=key), fingerprint)
+
+        response = respond()
+        if response.status_code >= 500:
+            # Not a final answer: undo the view's writes with the key so a
+            # retry runs the request again from scratch
+            transaction.set_rollback(True)
+            return response
+        record.status_code = response.status_code
+        record.response = response.data
+        record.headers = dict(response.items())
+        record.save(update_fields=['status_code', 'response', 'headers'])
+        _schedule_prune()
+    return response
+
+
+def _replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response(
+            {'detail': f'This {HEADER} was already used for a different request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(
+        record.response, status=record.status_code,
+        headers={**record.headers, 'Idempotent-Replayed': 'true'},
+    )
+
+
+def _schedule_prune():
+    # One sweep job per hour across processes, thanks to the job key
+    global _next_prune
+    if time.monotonic() < _next_prune:
+        return
+    _next_prune = time.monotonic() + PRUNE_INTERVAL
+    enqueue('idempotency.prune', key=f'idempotency-prune:{timezone.now():%Y%m%d%H}')
+
+
+@task('idempotency.prune')
+def prune_idempotency_keys():
+    IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
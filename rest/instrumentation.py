@@ -0,0 +1,240 @@
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the wall-time histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Anything else is reported as OTHER to keep the label set bounded
+KNOWN_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class RequestStats:
+    """What one request did: queries, time spent in the database and in the view."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = {}
+        self.view = 'unmatched'
+        self.action = ''
+        self.view_started = None
+        self.view_db_seconds = 0.0
+        self.serializer_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Run around every statement of the request, see observe_statement
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] = self.statements.get(sql, 0) + 1
+
+    def view_called(self, view_func):
+        cls = getattr(view_func, 'cls', None)
+        if cls is None:
+            self.view = f'{view_func.__module__}.{view_func.__name__}'
+        else:
+            self.view = cls.__name__
+        self.view_started = time.perf_counter()
+        self.view_db_seconds = self.db_seconds
+
+    def view_returned(self):
+        if self.view_started is not None:
+            elapsed = time.perf_counter() - self.view_started
+            self.serializer_seconds = elapsed - (self.db_seconds - self.view_db_seconds)
+
+    def duplicates(self, threshold):
+        """Statements run at least ``threshold`` times, the usual sign of an N+1."""
+        return {sql: count for sql, count in self.statements.items() if count >= threshold}
+
+
+class MetricsRegistry:
+    """Process-wide per-endpoint aggregates, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._series = {}
+
+    def observe(self, labels, stats, wall_seconds, duplicated):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {
+                    'requests': 0,
+                    'queries': 0,
+                    'db_seconds': 0.0,
+                    'serializer_seconds': 0.0,
+                    'wall_seconds': 0.0,
+                    'n_plus_one': 0,
+                    'buckets': [0] * len(LATENCY_BUCKETS),
+                }
+            series['requests'] += 1
+            series['queries'] += stats.queries
+            series['db_seconds'] += stats.db_seconds
+            series['serializer_seconds'] += max(stats.serializer_seconds, 0.0)
+            series['wall_seconds'] += wall_seconds
+            series['n_plus_one'] += bool(duplicated)
+            index = bisect_left(LATENCY_BUCKETS, wall_seconds)
+            if index < len(LATENCY_BUCKETS):
+                series['buckets'][index] += 1
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: {**series, 'buckets': list(series['buckets'])}
+                    for labels, series in self._series.items()}
+
+    def render(self):
+        series = sorted(self.snapshot().items())
+        lines = []
+
+        def family(name, kind, help_text, key):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, values in series:
+                lines.append(f'{name}{{{_labels(labels)}}} {values[key]}')
+
+        family('rest_requests_total', 'counter', 'Requests served.', 'requests')
+        family('rest_db_queries_total', 'counter', 'SQL statements executed.', 'queries')
+        family('rest_db_seconds_total', 'counter', 'Time spent waiting on SQL statements.', 'db_seconds')
+        family('rest_serializer_seconds_total', 'counter',
+               'Time spent in the view outside the database (serialization).', 'serializer_seconds')
+        family('rest_n_plus_one_requests_total', 'counter',
+               'Requests that repeated one SQL statement past the duplicate threshold.', 'n_plus_one')
+
+        name = 'rest_request_duration_seconds'
+        lines.append(f'# HELP {name} Wall time from middleware entry to rendered response.')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, values['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{_labels(labels, le=bound)}}} {cumulative}')
+            lines.append(f'{name}_bucket{{{_labels(labels, le="+Inf")}}} {values["requests"]}')
+            lines.append(f'{name}_sum{{{_labels(labels)}}} {values["wall_seconds"]}')
+            lines.append(f'{name}_count{{{_labels(labels)}}} {values["requests"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels, **extra):
+    view, action, method = labels
+    pairs = {'view': view, 'action': action, 'method': method, **extra}
+    return ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in pairs.items()
+    )
+
+
+registry = MetricsRegistry()
+
+# The stats of the request being served. Under ASGI the ORM runs in
+# sync_to_async worker threads, which copy this context but have
+# connections of their own, so the statement hook is installed on every
+# connection and finds the request through here.
+_current_stats = ContextVar('request_stats', default=None)
+
+
+def observe_statement(execute, sql, params, many, context):
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_statement_hook(sender, connection, **kwargs):
+    if observe_statement not in connection.execute_wrappers:
+        connection.execute_wrappers.append(observe_statement)
+
+
+class RequestMetricsMiddleware:
+    """Record query count, DB time, serializer time and wall time per endpoint.
+
+    Statements are counted by an execute wrapper installed on every
+    connection as it opens, whichever thread runs it, so it works with
+    DEBUG off and under ASGI; the per-query cost is two clock reads and a dict update.
+    DRF views are keyed by viewset class and action. Requests that run the
+    same statement ``REQUEST_METRICS_DUPLICATE_THRESHOLD`` times or more are
+    logged and counted as N+1 suspects. Turn it off with
+    ``REQUEST_METRICS_ENABLED = False``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'REQUEST_METRICS_DUPLICATE_THRESHOLD', 5)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Connections this thread opened before the hook was registered
+        for connection in connections.all(initialized_only=True):
+            install_statement_hook(None, connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = request._request_stats = RequestStats()
+        token = _current_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        self._record(request, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = request._request_stats = RequestStats()
+        token = _current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        self._record(request, stats)
+        return response
+
+    def _record(self, request, stats):
+        wall_seconds = time.perf_counter() - stats.started
+        duplicated = stats.duplicates(self.threshold)
+        if duplicated:
+            sql, count = max(duplicated.items(), key=lambda item: item[1])
+            logger.warning(
+                'Possible N+1 in %s.%s: statement ran %d times: %s',
+                stats.view, stats.action, count, sql,
+            )
+        method = request.method if request.method in KNOWN_METHODS else 'OTHER'
+        registry.observe((stats.view, stats.action, method), stats, wall_seconds, duplicated)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = request._request_stats
+        stats.view_called(view_func)
+        actions = getattr(view_func, 'actions', None) or {}
+        stats.action = actions.get(request.method.lower(), '')
+
+    def process_template_response(self, request, response):
+        # DRF responses come through here after the view built their data
+        # and before the renderer runs
+        request._request_stats.view_returned()
+        return response
@@ -0,0 +1,302 @@
+"""Background jobs: a queue table worked by a pool of threads.
+
+A task is a function registered with ``@task``. ``enqueue()`` stores a Job
+row in the caller's transaction, so a job exists exactly when the writes
+that asked for it commit, and it survives restarts until a worker runs it.
+JobRunner threads (started by the WSGI/ASGI entry points, or by
+``manage.py run_jobs``) claim due jobs under a lease; a job whose worker
+died is claimed again once the lease runs out. A failing job is retried
+with exponential backoff up to its task's ``max_attempts`` and then left
+as failed for inspection in the admin.
+
+A task runs in the transaction that marks its job done, so one that only
+writes to the database takes effect once. Tasks with outside effects
+(mail) may see a repeat if a worker dies between the two.
+"""
+import logging
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import Job
+from .retry import retry_on_lock
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+
+
+class LeaseLost(Exception):
+    """Another worker claimed the job after this one's lease ran out."""
+
+
+def task(name, max_attempts=5):
+    """Register the decorated function as task ``name``, called with the job's payload."""
+    def register(func):
+        _tasks[name] = (func, max_attempts)
+        return func
+    return register
+
+
+def enqueue(name, payload=None, key=None, delay=0):
+    """Queue task ``name`` with keyword arguments ``payload`` (JSON-serializable).
+
+    Returns the Job, or None when a job under ``key`` is already stored;
+    keys are remembered for as long as their job is kept.
+    """
+    _, max_attempts = _tasks[name]
+    job = Job(task=name, payload=payload or {}, key=key, max_attempts=max_attempts)
+    if delay:
+        job.run_after = timezone.now() + timedelta(seconds=delay)
+    if key is None:
+        job.save()
+    else:
+        try:
+            with transaction.atomic():
+                job.save()
+        except IntegrityError:
+            return None
+    transaction.on_commit(wake_workers)
+    return job
+
+
+def enqueue_many(name, entries):
+    """Queue task ``name`` once per ``(payload, key)`` pair in one insert, skipping stored keys."""
+    _, max_attempts = _tasks[name]
+    Job.objects.bulk_create(
+        [Job(task=name, payload=payload, key=key, max_attempts=max_attempts) for payload, key in entries],
+        ignore_conflicts=True,
+    )
+    transaction.on_commit(wake_workers)
+
+
+def _due(now):
+    return Q(status='queued', run_after__lte=now) | Q(status='running', locked_until__lt=now)
+
+
+@retry_on_lock
+def claim_job():
+    """Lease the next due job to the calling thread, or return None when there is none.
+
+    The conditional UPDATE is the claim, so two workers can't both take a
+    job on any database.
+    """
+    lease = timedelta(seconds=getattr(settings, 'BACKGROUND_JOBS_LEASE_SECONDS', 300))
+    while True:
+        now = timezone.now()
+        candidates = list(Job.objects.filter(_due(now)).order_by('run_after', 'id')[:10])
+        if not candidates:
+            return None
+        for job in candidates:
+            claimed = Job.objects.filter(_due(now), pk=job.pk).update(
+                status='running', attempts=F('attempts') + 1, locked_until=now + lease,
+            )
+            if claimed:
+                job.status, job.attempts, job.locked_until = 'running', job.attempts + 1, now + lease
+                return job
+
+
+def _finish(job, **fields):
+    """Update the job if this worker still holds its lease."""
+    updated = Job.objects.filter(pk=job.pk, status='running', locked_until=job.locked_until).update(**fields)
+    if not updated:
+        raise LeaseLost(job.pk)
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome; returns 'done', 'retry', 'failed' or 'lost'."""
+    started = time.perf_counter()
+    func, _ = _tasks.get(job.task, (None, None))
+    try:
+        if func is None:
+            raise LookupError(f"No task registered as {job.task!r}")
+        if job.attempts > job.max_attempts:
+            raise RuntimeError("Lease expired on every attempt")
+        with transaction.atomic():
+            func(**job.payload)
+            _finish(job, status='done', locked_until=None, finished_at=timezone.now())
+        outcome = 'done'
+    except LeaseLost:
+        logger.warning("Job %s outlived its lease; its work was rolled back", job.pk)
+        outcome = 'lost'
+    except Exception:
+        logger.exception("Job %s (%s) failed on attempt %d of %d", job.pk, job.task, job.attempts, job.max_attempts)
+        outcome = _record_failure(job, traceback.format_exc())
+    stats.observe(job.task, outcome, time.perf_counter() - started)
+    return outcome
+
+
+def _record_failure(job, error):
+    now = timezone.now()
+    try:
+        if job.attempts >= job.max_attempts:
+            _finish(job, status='failed', locked_until=None, finished_at=now, last_error=error)
+            return 'failed'
+        delay = getattr(settings, 'BACKGROUND_JOBS_RETRY_SECONDS', 10) * 2 ** (job.attempts - 1)
+        _finish(job, status='queued', locked_until=None, run_after=now + timedelta(seconds=delay), last_error=error)
+        return 'retry'
+    except LeaseLost:
+        return 'lost'
+
+
+def run_pending(limit=None):
+    """Run due jobs in the calling thread until none are left (or ``limit`` ran); returns the count."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_job()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+def prune_jobs():
+    """Delete done jobs older than ``BACKGROUND_JOBS_KEEP_HOURS``, freeing their keys."""
+    hours = getattr(settings, 'BACKGROUND_JOBS_KEEP_HOURS', 24)
+    cutoff = timezone.now() - timedelta(hours=hours)
+    deleted, _ = Job.objects.filter(status='done', finished_at__lt=cutoff).delete()
+    return deleted
+
+
+class JobStats:
+    """Per-task outcome counts and run time of the jobs this process ran."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._seconds = {}
+
+    def observe(self, task_name, outcome, seconds):
+        with self._lock:
+            self._counts[(task_name, outcome)] = self._counts.get((task_name, outcome), 0) + 1
+            self._seconds[task_name] = self._seconds.get(task_name, 0.0) + seconds
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+            self._seconds.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts), dict(self._seconds)
+
+
+stats = JobStats()
+
+
+def render_metrics():
+    """Queue depth and lag from the table, plus this process's job counters, in Prometheus text format."""
+    now = timezone.now()
+    depth = dict(Job.objects.values_list('status').annotate(count=Count('id')).order_by())
+    oldest = Job.objects.filter(status='queued', run_after__lte=now).aggregate(oldest=Min('run_after'))['oldest']
+    lag = (now - oldest).total_seconds() if oldest else 0.0
+    counts, seconds = stats.snapshot()
+
+    lines = [
+        '# HELP rest_jobs Jobs in the queue table by status.',
+        '# TYPE rest_jobs gauge',
+    ]
+    for value, _ in Job.STATUS_CHOICES:
+        lines.append(f'rest_jobs{{status="{value}"}} {depth.get(value, 0)}')
+    lines += [
+        '# HELP rest_jobs_lag_seconds How long the oldest due job has been waiting for a worker.',
+        '# TYPE rest_jobs_lag_seconds gauge',
+        f'rest_jobs_lag_seconds {lag}',
+        '# HELP rest_jobs_processed_total Jobs run by this process, by task and outcome.',
+        '# TYPE rest_jobs_processed_total counter',
+    ]
+    for (task_name, outcome), count in sorted(counts.items()):
+        lines.append(f'rest_jobs_processed_total{{task="{task_name}",outcome="{outcome}"}} {count}')
+    lines += [
+        '# HELP rest_jobs_seconds_total Time this process spent running jobs, by task.',
+        '# TYPE rest_jobs_seconds_total counter',
+    ]
+    for task_name, total in sorted(seconds.items()):
+        lines.append(f'rest_jobs_seconds_total{{task="{task_name}"}} {total}')
+    return '\n'.join(lines) + '\n'
+
+
+class JobRunner:
+    """A pool of worker threads draining the queue table."""
+
+    # Seconds between prunes of finished jobs
+    prune_interval = 600
+
+    def __init__(self, workers=None, poll_seconds=None):
+        self.workers = workers if workers is not None else getattr(settings, 'BACKGROUND_JOBS_WORKERS', 2)
+        self.poll_seconds = poll_seconds or getattr(settings, 'BACKGROUND_JOBS_POLL_SECONDS', 5)
+        self._threads = []
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._prune_lock = threading.Lock()
+        self._next_prune = 0.0
+
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'jobs-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        self._wake.set()
+
+    def _work(self):
+        try:
+            while not self._stopping.is_set():
+                ran = False
+                try:
+                    self._maybe_prune()
+                    job = claim_job()
+                    if job is not None:
+                        run_job(job)
+                        ran = True
+                except Exception:
+                    logger.exception("Job worker error")
+                finally:
+                    close_old_connections()
+                if not ran:
+                    self._wake.wait(self.poll_seconds)
+                    self._wake.clear()
+        finally:
+            connection.close()
+
+    def _maybe_prune(self):
+        with self._prune_lock:
+            if time.monotonic() < self._next_prune:
+                return
+            self._next_prune = time.monotonic() + self.prune_interval
+        prune_jobs()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def start_workers():
+    """Start this process's JobRunner, unless ``BACKGROUND_JOBS_WORKERS`` is 0 or it already runs."""
+    global _runner
+    with _runner_lock:
+        if _runner is None and getattr(settings, 'BACKGROUND_JOBS_WORKERS', 2) > 0:
+            _runner = JobRunner()
+            _runner.start()
+        return _runner
+
+
+def wake_workers():
+    runner = _runner
+    if runner is not None:
+        runner.wake()
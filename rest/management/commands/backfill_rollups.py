@@ -0,0 +1,59 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rest.models import CategorySalesRollup, Job, Order, OrderStatusRollup, ProductSalesRollup
+from rest.rollups import RollupDelta, order_lines
+
+
+class Command(BaseCommand):
+    help = "Rebuild the sales and status rollup tables from order history, in one transaction"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        # One transaction from clearing the tables to the last chunk, so a
+        # status change can't land between them and be lost or counted
+        # twice; on SQLite it holds the write lock, and order writes queue
+        # behind the rebuild. Chunks only bound the memory it takes.
+        with transaction.atomic():
+            processed = self._rebuild(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {processed} orders"))
+
+    def _rebuild(self, chunk_size):
+        ProductSalesRollup.objects.all().delete()
+        CategorySalesRollup.objects.all().delete()
+        OrderStatusRollup.objects.all().delete()
+        # Orders are counted as they are now, so pending transitions are
+        # already included. Deleting a running job too makes its worker
+        # fail to mark it done, which rolls its delta back.
+        Job.objects.filter(task='rollups.status_change', status__in=['queued', 'running']).delete()
+
+        last_id = 0
+        processed = 0
+        while True:
+            orders = list(
+                Order.objects
+                .filter(pk__gt=last_id)
+                .order_by('pk')
+                .values('id', 'order_date', 'status')[:chunk_size]
+            )
+            if not orders:
+                break
+            last_id = orders[-1]['id']
+
+            completed = [order['id'] for order in orders if order['status'] == 'completed']
+            lines_by_order = defaultdict(list)
+            for line in order_lines(completed):
+                lines_by_order[line['order_id']].append(line)
+
+            delta = RollupDelta()
+            for order in orders:
+                delta.add_status(order['order_date'], order['status'])
+                if order['status'] == 'completed':
+                    delta.add_sales(order['order_date'], lines_by_order[order['id']])
+            delta.apply()
+            processed += len(orders)
+        return processed
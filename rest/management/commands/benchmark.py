@@ -0,0 +1,90 @@
+import inspect
+import json
+import platform
+import subprocess
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from rest.benchmarks import SUITES
+
+VOLUMES = ('categories', 'products', 'orders', 'customers')
+CONCURRENCY = ('clients', 'polls', 'workers', 'db_latency_ms')
+
+
+class Command(BaseCommand):
+    help = "Run the benchmark suites and optionally save the results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', help=f"Suites to run (default: all of {', '.join(SUITES)})")
+        parser.add_argument('--scale', type=int, default=1, help="Multiplier for seeded data volumes")
+        parser.add_argument('--output', help="Write results to this JSON file")
+        volumes = parser.add_argument_group('data volumes', "Seeded row counts for suites that take them")
+        for volume in VOLUMES:
+            volumes.add_argument(f'--{volume}', type=int)
+        parser.add_argument('--repeat', type=int, help="Timed calls per measurement, for suites that take it")
+        concurrency = parser.add_argument_group('concurrency', "Options of the asgi suite")
+        for option in CONCURRENCY:
+            concurrency.add_argument(f"--{option.replace('_', '-')}", dest=option, type=int)
+
+    def handle(self, *args, **options):
+        names = options['suites'] or list(SUITES)
+        unknown = set(names) - SUITES.keys()
+        if unknown:
+            raise CommandError(f"Unknown suites: {', '.join(sorted(unknown))}")
+
+        overrides = {
+            key: options[key] for key in (*VOLUMES, *CONCURRENCY, 'repeat') if options[key] is not None
+        }
+        results = {}
+        for name in names:
+            self.stdout.write(f"Running {name}...")
+            func = SUITES[name]
+            parameters = inspect.signature(func).parameters
+            kwargs = {key: value for key, value in overrides.items() if key in parameters}
+            if func.needs_database:
+                with scratch_database():
+                    results[name] = func(scale=options['scale'], **kwargs)
+            else:
+                results[name] = func(scale=options['scale'], **kwargs)
+            self.stdout.write(json.dumps(results[name], indent=2, default=str))
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump({
+                    'commit': _git_commit(),
+                    'python': platform.python_version(),
+                    'scale': options['scale'],
+                    'overrides': overrides,
+                    'results': results,
+                }, fh, indent=2, default=str)
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['output']}"))
+
+
+@contextmanager
+def scratch_database():
+    """A throwaway test database so suites never touch real data.
+
+    The test environment is set up too, so the test client can be used
+    against it.
+    """
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
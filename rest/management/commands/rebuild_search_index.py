@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from rest.models import Product
+from rest.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Reindex every product for search, e.g. after bulk imports that skip signals"
+
+    def handle(self, *args, **options):
+        get_search_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {Product.objects.count()} products"))
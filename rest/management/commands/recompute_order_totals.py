@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from rest.models import LINE_TOTAL, Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = "Recompute Order.total_amount from order items in primary-key chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = 0
+        scanned = changed = 0
+
+        while True:
+            orders = list(
+                Order.objects
+                .filter(pk__gt=last_id)
+                .order_by('pk')
+                .only('id', 'total_amount')[:chunk_size]
+            )
+            if not orders:
+                break
+            last_id = orders[-1].pk
+
+            totals = dict(
+                OrderItem.objects
+                .filter(order_id__in=[order.pk for order in orders])
+                .values('order_id')
+                .annotate(total=Sum(LINE_TOTAL))
+                .values_list('order_id', 'total')
+            )
+            stale = []
+            for order in orders:
+                total = Order._meta.get_field('total_amount').to_python(totals.get(order.pk) or 0)
+                if order.total_amount != total:
+                    order.total_amount = total
+                    stale.append(order)
+
+            with transaction.atomic():
+                Order.objects.bulk_update(stale, ['total_amount'])
+
+            scanned += len(orders)
+            changed += len(stale)
+
+        self.stdout.write(self.style.SUCCESS(f"Recomputed {scanned} orders, {changed} updated"))
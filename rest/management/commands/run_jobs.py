@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rest.jobs import JobRunner, run_pending
+
+
+class Command(BaseCommand):
+    help = "Work the background job queue in this process until interrupted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Worker threads (default: BACKGROUND_JOBS_WORKERS)")
+        parser.add_argument('--once', action='store_true', help="Run the jobs that are due now and exit")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            count = run_pending()
+            self.stdout.write(self.style.SUCCESS(f"Ran {count} jobs"))
+            return
+        runner = JobRunner(workers=options['workers'] or max(settings.BACKGROUND_JOBS_WORKERS, 1))
+        runner.start()
+        self.stdout.write(f"Working the job queue with {runner.workers} threads; Ctrl-C to stop")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            runner.stop()
@@ -0,0 +1,64 @@
+from itertools import groupby
+
+from django.core.cache import cache
+
+from .catalog import aget_catalog_version, bump_catalog_version, get_catalog_version
+from .models import Product
+from .fast_serializers import fast_product_serializer
+
+
+MENU_CACHE_KEY = 'menu:v{version}'
+MENU_CACHE_TIMEOUT = 60 * 60
+
+
+class MenuEngine:
+    """Builds the category -> available products menu and caches it per catalog version."""
+
+    timeout = MENU_CACHE_TIMEOUT
+
+    def get_queryset(self):
+        return (
+            Product.objects
+            .filter(is_available=True, category__is_active=True)
+            .order_by('category_id', '-created_at')
+            .values(*fast_product_serializer.lookups, 'category_id', 'category__description')
+        )
+
+    def build(self, rows=None):
+        """Build the whole menu from one joined query (or its already fetched ``rows``)."""
+        if rows is None:
+            rows = self.get_queryset()
+        menu = []
+        for category_id, rows in groupby(rows, key=lambda row: row['category_id']):
+            rows = list(rows)
+            menu.append({
+                'category_id': category_id,
+                'category_name': rows[0]['category__name'],
+                'category_description': rows[0]['category__description'],
+                'products': fast_product_serializer.many(rows),
+            })
+        return menu
+
+    def get_menu(self):
+        """Return the rendered menu, building it only on a cache miss."""
+        key = MENU_CACHE_KEY.format(version=get_catalog_version())
+        menu = cache.get(key)
+        if menu is None:
+            menu = self.build()
+            cache.set(key, menu, self.timeout)
+        return menu
+
+    async def aget_menu(self):
+        """Async get_menu(), for async views."""
+        key = MENU_CACHE_KEY.format(version=await aget_catalog_version())
+        menu = await cache.aget(key)
+        if menu is None:
+            menu = self.build([row async for row in self.get_queryset()])
+            await cache.aset(key, menu, self.timeout)
+        return menu
+
+    def invalidate(self):
+        bump_catalog_version()
+
+
+menu_engine = MenuEngine()
@@ -0,0 +1,39 @@
+from django.db import migrations
+from django.db.models import Exists, Max, OuterRef, Subquery
+
+BATCH_SIZE = 10000
+
+
+def link_orders(apps, schema_editor):
+    """Link orders to the Customer whose username equals the order's customer text.
+
+    Walks the orders table in id ranges so each UPDATE is short; the
+    migration is non-atomic, so every range commits on its own and a
+    failed run can simply be re-run.
+    """
+    Order = apps.get_model('rest', 'Order')
+    Customer = apps.get_model('rest', 'Customer')
+    db = schema_editor.connection.alias
+
+    last_id = Order.objects.using(db).aggregate(last=Max('id'))['last'] or 0
+    matching = Customer.objects.using(db).filter(user__username=OuterRef('customer'))
+    for start in range(0, last_id, BATCH_SIZE):
+        (
+            Order.objects.using(db)
+            .filter(id__gt=start, id__lte=start + BATCH_SIZE, customer_account__isnull=True)
+            .filter(Exists(matching))
+            .update(customer_account=Subquery(matching.values('pk')[:1]))
+        )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('rest', '0002_order_customer_account'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+import rest.models
+
+
+def create_index(apps, schema_editor):
+    """Create and fill the FTS5 product index; other databases search with LikeBackend."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE rest_product_search USING fts5('
+        "name, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    # Default rank: bm25 with a name hit worth ten description hits
+    schema_editor.execute(
+        "INSERT INTO rest_product_search (rest_product_search, rank) VALUES ('rank', 'bm25(10.0, 1.0)')"
+    )
+    schema_editor.execute(
+        'INSERT INTO rest_product_search (rowid, name, description) '
+        "SELECT id, name, COALESCE(description, '') FROM rest_product"
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS rest_product_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0003_link_order_customer_accounts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchEntry',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='rest.product')),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+                ('document', rest.models.SearchDocumentField(db_column='rest_product_search')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'rest_product_search',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
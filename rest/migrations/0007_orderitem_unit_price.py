@@ -0,0 +1,33 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def price_existing_lines(apps, schema_editor):
+    """Existing lines take the product's current price, which is what totals used until now."""
+    OrderItem = apps.get_model('rest', 'OrderItem')
+    Product = apps.get_model('rest', 'Product')
+    db = schema_editor.connection.alias
+    OrderItem.objects.using(db).filter(unit_price__isnull=True).update(
+        unit_price=Subquery(Product.objects.using(db).filter(pk=OuterRef('product_id')).values('price')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0006_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(price_existing_lines, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+    ]
@@ -1,5 +1,26 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .exceptions import OutOfStock
+from .retry import retry_on_lock
+
+
+# Sent inside Order.save's transaction when an order is created or its
+# status changes; old_status is None for new orders.
+order_status_changed = Signal()
+# Sent with order_id, delta and the Order as ``order`` when it is loaded
+order_total_changed = Signal()
+# Sent inside OrderItem.save/delete with the item's order and its line
+# before and after as (product_id, quantity, unit_price), None when absent.
+order_line_changed = Signal()
 
 class User(AbstractUser):
     ROLE_CHOICES = [
@@ -18,6 +39,35 @@ class Category(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    """Atomic stock reservations; ``needed`` may be an int or a per-row expression.
+
+    Products with ``stock=None`` are untracked and never touched here.
+    """
+
+    def reserve(self, needed):
+        """Take stock from every row that has enough, returning how many rows did."""
+        updated = self.filter(stock__isnull=False, stock__gte=needed).update(
+            stock=F('stock') - needed,
+            is_available=Case(When(stock=needed, then=Value(False)), default=Value(True)),
+            updated_at=Case(When(stock=needed, then=Value(timezone.now())), default=F('updated_at')),
+        )
+        if updated and self.filter(stock=0).exists():
+            bump_catalog_version()
+        return updated
+
+    def release(self, needed):
+        tracked = self.filter(stock__isnull=False)
+        restocked = tracked.filter(stock=0).exists()
+        tracked.update(
+            stock=F('stock') + needed,
+            is_available=True,
+            updated_at=Case(When(stock=0, then=Value(timezone.now())), default=F('updated_at')),
+        )
+        if restocked:
+            bump_catalog_version()
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
@@ -32,6 +82,11 @@ class Product(models.Model):
         null=True
     )
     is_available = models.BooleanField(default=True)
+    stock = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Units left to sell; leave empty to not track stock"
+    )
     preparation_time = models.PositiveIntegerField(
         help_text="Preparation time in minutes",
         default=15
@@ -39,11 +94,58 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} - ${self.price}"
 
+    def save(self, *args, **kwargs):
+        if self.stock is not None:
+            self.is_available = self.stock > 0
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+            models.Index(fields=['is_available', 'category', 'price'], name='product_avail_cat_price_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+        ]
+
+
+class SearchDocumentField(models.TextField):
+    """The whole-row column of a full-text table, the left side of MATCH."""
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+class ProductSearchEntry(models.Model):
+    """A product's row in the SQLite FTS5 index maintained by rest.search.
+
+    Joined to Product on the FTS rowid; ``rank`` is only defined in
+    queries that filter on ``document__match``.
+    """
+    product = models.OneToOneField(
+        Product, primary_key=True, db_column='rowid', related_name='search_entry',
+        on_delete=models.DO_NOTHING, db_constraint=False,
+    )
+    name = models.TextField()
+    description = models.TextField()
+    document = SearchDocumentField(db_column='rest_product_search')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'rest_product_search'
+
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -53,49 +155,310 @@ class Order(models.Model):
     ]
 
     customer = models.CharField(max_length=255) 
+    # Registered customer placing the order; walk-in/table orders only have
+    # the free-text name above. Indexed together with order_date below.
+    customer_account = models.ForeignKey(
+        'Customer', null=True, blank=True, on_delete=models.SET_NULL,
+        related_name='orders', db_index=False,
+    )
     order_date = models.DateTimeField(auto_now_add=True)
     total_amount = models.DecimalField(max_digits=7, decimal_places=2, default=0)
     status = models.CharField(max_length=50, choices=STATUS_CHOICES)
     notess = models.TextField(blank=True, null=True)
-    
+
+    class Meta:
+        ordering = ['-order_date', '-id']
+        indexes = [
+            models.Index(fields=['-order_date', '-id'], name='order_date_id_idx'),
+            models.Index(fields=['status', 'order_date'], name='order_status_date_idx'),
+            models.Index(fields=['customer', 'order_date'], name='order_customer_date_idx'),
+            models.Index(fields=['customer_account', '-order_date', '-id'], name='order_account_date_idx'),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} - {self.customer}"
     
     def update_total(self):
-        """Recalculate total_amount from OrderItems"""
-        self.total_amount = sum(
-            item.get_total_price() for item in self.order_items.all()
-        )
-        self.save()
+        """Recalculate total_amount from OrderItems with a single aggregate"""
+        old_total = self.total_amount
+        self.total_amount = self.order_items.aggregate(
+            total=Coalesce(Sum(LINE_TOTAL), Value(Decimal('0')), output_field=TOTAL_FIELD)
+        )['total']
+        Order.objects.filter(pk=self.pk).update(total_amount=self.total_amount)
+        if self.total_amount != old_total:
+            order_total_changed.send(
+                sender=Order, order=self, order_id=self.pk, delta=self.total_amount - (old_total or 0),
+            )
+
+    def adjust_total(self, delta):
+        """Apply an incremental change to total_amount without a recompute"""
+        if not delta:
+            return
+        Order.objects.filter(pk=self.pk).update(total_amount=F('total_amount') + delta)
+        self.total_amount = (self.total_amount or 0) + delta
+        order_total_changed.send(sender=Order, order=self, order_id=self.pk, delta=delta)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'status' in field_names:
+            instance._loaded_status = values[field_names.index('status')]
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if fields is None or 'status' in fields:
+            self._loaded_status = self.status
+
+    @retry_on_lock
     def save(self, *args, **kwargs):
-        if self.status == 'completed':
-            self._mark_products_unavailable()
-        elif self.status in ['pending', 'canceled']:
-            self._mark_products_available()
-        super().save(*args, **kwargs)
-    
-    def _mark_products_unavailable(self):
-        for item in self.order_items.all():
-            item.product.is_available = False
-            item.product.save()
-    
-    def _mark_products_available(self):
-        for item in self.order_items.all():
-            item.product.is_available = True
-            item.product.save()
+        # Stock is reserved while an order is live and handed back when it is
+        # canceled; a new order has no items yet so there is nothing to move.
+        created = self._state.adding
+        old_status = None if created else getattr(self, '_loaded_status', None)
+        status_changed = not created and self.status != old_status
+        if not created:
+            # total_amount is only written by update_total/adjust_total, with
+            # F() increments; saving a stale in-memory copy would lose theirs.
+            # An explicit update_fields (even an empty, no-op one) is narrowed,
+            # not widened.
+            if 'update_fields' in kwargs:
+                fields = kwargs['update_fields']
+                status_changed = status_changed and 'status' in fields
+            else:
+                fields = self._saved_field_names()
+            kwargs['update_fields'] = [name for name in fields if name != 'total_amount']
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if status_changed:
+                if self.status == 'canceled':
+                    self._release_stock()
+                elif old_status == 'canceled':
+                    self._reserve_stock()
+            if created or status_changed:
+                order_status_changed.send(
+                    sender=Order, order=self, old_status=old_status, created=created,
+                )
+        self._loaded_status = self.status
+
+    def _saved_field_names(self):
+        return [field.name for field in self._meta.concrete_fields if not field.primary_key]
+
+    def _item_quantities(self):
+        """Per-product quantity on this order, correlated to the outer Product row."""
+        return Subquery(
+            OrderItem.objects
+            .filter(order_id=self.pk, product_id=OuterRef('pk'))
+            .values('product_id')
+            .annotate(total=Sum('quantity'))
+            .values('total')
+        )
+
+    def _reserve_stock(self):
+        products = Product.objects.filter(id__in=self.order_items.values('product_id'))
+        tracked = products.filter(stock__isnull=False).count()
+        if tracked and products.reserve(self._item_quantities()) != tracked:
+            raise OutOfStock()
+
+    def _release_stock(self):
+        Product.objects.filter(id__in=self.order_items.values('product_id')).release(self._item_quantities())
+
+LINE_TOTAL = F('quantity') * F('unit_price')
+TOTAL_FIELD = models.DecimalField(max_digits=7, decimal_places=2)
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='order_items')
     product = models.ForeignKey(Product, on_delete=models.PROTECT)  # PROTECT to preserve order history
     quantity = models.PositiveIntegerField(default=1)
+    # Product price when the line was added (or its product changed); totals,
+    # rollups and receipts use it so later price edits don't rewrite history.
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     
     def __str__(self):
         return f"{self.quantity}x {self.product.name} (Order #{self.order.id})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        instance._loaded_line = (loaded.get('product_id'), loaded.get('quantity'))
+        instance._loaded_price = loaded.get('unit_price')
+        return instance
+
     def get_total_price(self):
-        return self.product.price * self.quantity
+        return self.unit_price * self.quantity
+
+    def _loaded_line_total(self):
+        product_id, quantity = getattr(self, '_loaded_line', (None, None))
+        if product_id is None or not quantity:
+            return Decimal('0')
+        price = getattr(self, '_loaded_price', None)
+        return (self.unit_price if price is None else price) * quantity
+
+    @retry_on_lock
+    def save(self, *args, **kwargs):
+        # Price the line when it is added (unless the caller did) or moved to another product
+        product_changed = self.product_id != getattr(self, '_loaded_line', (None,))[0]
+        if self.unit_price is None or (product_changed and not self._state.adding):
+            self.unit_price = self.product.price
+        self.unit_price = self._meta.get_field('unit_price').to_python(self.unit_price)
+        # Keep Order.total_amount current by applying only this line's delta
+        delta = self.get_total_price() - self._loaded_line_total()
+        with transaction.atomic():
+            self._move_stock(self.product_id, self.quantity)
+            super().save(*args, **kwargs)
+            self.order.adjust_total(delta)
+            self._line_changed((self.product_id, self.quantity, self.unit_price))
+        self._loaded_line = (self.product_id, self.quantity)
+        self._loaded_price = self.unit_price
+
+    @retry_on_lock
+    def delete(self, *args, **kwargs):
+        delta = -self._loaded_line_total()
+        with transaction.atomic():
+            self._move_stock(None, 0)
+            result = super().delete(*args, **kwargs)
+            self.order.adjust_total(delta)
+            self._line_changed(None)
+        return result
+
+    def _line_changed(self, new_line):
+        product_id, quantity = getattr(self, '_loaded_line', (None, None))
+        old_line = None
+        if product_id is not None and quantity:
+            price = getattr(self, '_loaded_price', None)
+            old_line = (product_id, quantity, self.unit_price if price is None else price)
+        if old_line != new_line:
+            order_line_changed.send(sender=OrderItem, order=self.order, old_line=old_line, new_line=new_line)
+
+    def _move_stock(self, product_id, quantity):
+        """Reserve/release the difference between the stored line and the new one.
+
+        Loads self.order, whose total save()/delete() then adjust in place.
+        """
+        if self.order.status == 'canceled':
+            return
+        old_product_id, old_quantity = getattr(self, '_loaded_line', (None, 0))
+        changes = {}
+        if old_product_id is not None:
+            changes[old_product_id] = -old_quantity
+        if product_id is not None:
+            changes[product_id] = changes.get(product_id, 0) + quantity
+        for pk, change in changes.items():
+            products = Product.objects.filter(pk=pk)
+            if change > 0:
+                # Only the current product can gain quantity
+                if products.reserve(change) == 0 and self.product.stock is not None:
+                    raise OutOfStock()
+            elif change < 0:
+                products.release(-change)
+
+
+
+
+ROLLUP_PERIOD_CHOICES = [
+    ('hour', 'Hourly'),
+    ('day', 'Daily'),
+]
+
+
+class ProductSalesRollup(models.Model):
+    """Completed-order sales per product per hour/day bucket of order_date."""
+    period = models.CharField(max_length=4, choices=ROLLUP_PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_rollups')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.IntegerField(default=0)
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'product'], name='product_rollup_unique'),
+        ]
+
 
+class CategorySalesRollup(models.Model):
+    """Completed-order sales per category per hour/day bucket of order_date."""
+    period = models.CharField(max_length=4, choices=ROLLUP_PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='sales_rollups')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.IntegerField(default=0)
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'category'], name='category_rollup_unique'),
+        ]
+
+
+class OrderStatusRollup(models.Model):
+    """Number of orders currently in each status per hour/day bucket of order_date."""
+    period = models.CharField(max_length=4, choices=ROLLUP_PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    status = models.CharField(max_length=50, choices=Order.STATUS_CHOICES)
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'status'], name='status_rollup_unique'),
+        ]
+
+
+class Job(models.Model):
+    """A queued call of a rest.jobs task, kept in the database so it survives restarts."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # Enqueueing again under a key that is still stored is a no-op
+    key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Lease of the worker running it; a running job past this is picked up again
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """A client's Idempotency-Key and the response its first request got (see rest.idempotency)."""
+    # Endpoint and user the key was sent to; keys of different users never collide
+    scope = models.CharField(max_length=100)
+    key = models.CharField(max_length=255)
+    # sha256 of the request body, to refuse a key reused for a different request
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    # Headers the view set, e.g. Location of a created order
+    headers = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='idempotency_key_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
 
 
 from django.db import models
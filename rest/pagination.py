@@ -0,0 +1,113 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(PageNumberPagination):
+    """Page-number pagination with an opt-in keyset (cursor) mode.
+
+    Passing ``?cursor=`` (empty for the first page) switches to keyset mode:
+    rows are ordered newest first on ``keyset_fields`` and each page is found
+    with an index range on those columns instead of COUNT(*) plus OFFSET, so
+    deep pages cost the same as the first one. Keyset mode only walks forward.
+    """
+
+    keyset_fields = ('id',)
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    keyset = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        return self._keyset_page(list(self._keyset_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        """Keyset-mode paginate_queryset for async views, which always page by cursor."""
+        self.keyset = True
+        self.request = request
+        return self._keyset_page([row async for row in self._keyset_queryset(queryset, request)])
+
+    def _keyset_queryset(self, queryset, request):
+        self.limit = self.get_page_size(request) or self.max_page_size
+        queryset = queryset.order_by(*(f'-{field}' for field in self.keyset_fields))
+
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self._after(position))
+        return queryset[:self.limit + 1]
+
+    def _keyset_page(self, rows):
+        self.has_next = len(rows) > self.limit
+        self.page = rows[:self.limit]
+        return self.page
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['next']['description'] = (
+            'Next page URL; in cursor mode it carries an opaque cursor.'
+        )
+        return response_schema
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_previous_link(self):
+        if self.keyset:
+            return None
+        return super().get_previous_link()
+
+    def encode_cursor(self, obj):
+        if isinstance(obj, dict):
+            values = [obj[field] for field in self.keyset_fields]
+        else:
+            values = [getattr(obj, field) for field in self.keyset_fields]
+        raw = '|'.join(value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in values)
+        return urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            parts = urlsafe_b64decode(encoded.encode()).decode().split('|')
+            if len(parts) != len(self.keyset_fields):
+                raise ValueError
+            return [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.keyset_fields, parts)
+            ]
+        except (BinasciiError, UnicodeDecodeError, ValueError, ValidationError):
+            raise NotFound('Invalid cursor')
+
+    def _after(self, position):
+        # (a, b) < (va, vb) expanded so the leading column bounds the index range
+        condition = Q()
+        for i, field in enumerate(self.keyset_fields):
+            equal = {f: v for f, v in zip(self.keyset_fields[:i], position[:i])}
+            condition |= Q(**equal, **{f'{field}__lt': position[i]})
+        return Q(**{f'{self.keyset_fields[0]}__lte': position[0]}) & condition
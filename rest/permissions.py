@@ -1,3 +1,6 @@
+from hmac import compare_digest
+
+from django.conf import settings
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
 from rest_framework import permissions
@@ -12,3 +15,14 @@ class IsAdminOrReadOnly(permissions.BasePermission):
 
 
 
+
+
+class CanScrapeMetrics(BasePermission):
+    """Staff users, or a scraper sending the shared ``X-Metrics-Token`` header."""
+
+    def has_permission(self, request, view):
+        token = getattr(settings, 'REQUEST_METRICS_TOKEN', None)
+        sent = request.META.get('HTTP_X_METRICS_TOKEN')
+        if token and sent and compare_digest(token.encode(), sent.encode()):
+            return True
+        return bool(request.user and request.user.is_staff)
@@ -0,0 +1,43 @@
+from django.core.mail import send_mail
+
+from .jobs import enqueue, enqueue_many, task
+from .models import Order
+
+
+def queue_receipt(order):
+    """Mail the order's receipt from a background job, once per order."""
+    enqueue('orders.send_receipt', {'order_id': order.pk}, key=f'receipt:{order.pk}')
+
+
+def queue_receipts(orders):
+    """queue_receipt for many orders in one insert, e.g. a batch create."""
+    enqueue_many('orders.send_receipt', [({'order_id': order.pk}, f'receipt:{order.pk}') for order in orders])
+
+
+def render_receipt(order):
+    lines = [f"Order #{order.pk} - {order.order_date:%Y-%m-%d %H:%M}", ""]
+    for item in order.order_items.all():
+        # The prices the lines were added at, which total_amount is made of
+        lines.append(f"{item.quantity} x {item.product.name}  {item.get_total_price():.2f}")
+    lines += ["", f"Total: {order.total_amount:.2f}"]
+    return '\n'.join(lines)
+
+
+@task('orders.send_receipt', max_attempts=8)
+def send_receipt(order_id):
+    order = (
+        Order.objects
+        .select_related('customer_account__user')
+        .prefetch_related('order_items__product')
+        .filter(pk=order_id)
+        .first()
+    )
+    # Orders without a registered customer (walk-ins, tables) get a printed one
+    if order is None or order.customer_account is None or not order.customer_account.user.email:
+        return
+    send_mail(
+        f"Your receipt for order #{order.pk}",
+        render_receipt(order),
+        None,
+        [order.customer_account.user.email],
+    )
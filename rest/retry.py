@@ -0,0 +1,47 @@
+import logging
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+logger = logging.getLogger(__name__)
+
+LOCK_MESSAGES = ('database is locked', 'database table is locked')
+
+
+def is_lock_contention(exc):
+    return isinstance(exc, OperationalError) and any(message in str(exc) for message in LOCK_MESSAGES)
+
+
+def retry_on_lock(func):
+    """Run ``func`` in a transaction, retried when it can't get the SQLite write lock.
+
+    Only a failed BEGIN is retried: with ``transaction_mode`` IMMEDIATE the
+    write lock is taken there, before ``func`` has run, so running it again
+    is safe. A lock error raised once ``func`` is running is not retried,
+    since the instances it was saving may already be half-updated (a
+    primary key set, an in-memory total adjusted). Inside an enclosing
+    atomic block ``func`` just runs and errors go to the block's owner.
+    Retries back off exponentially with jitter, so colliding writers
+    spread out.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if transaction.get_connection().in_atomic_block:
+            return func(*args, **kwargs)
+        retries = getattr(settings, 'DATABASE_LOCK_RETRIES', 3)
+        delay = getattr(settings, 'DATABASE_LOCK_RETRY_DELAY', 0.05)
+        for attempt in range(retries + 1):
+            began = False
+            try:
+                with transaction.atomic():
+                    began = True
+                    return func(*args, **kwargs)
+            except OperationalError as exc:
+                if began or attempt == retries or not is_lock_contention(exc):
+                    raise
+                logger.warning('%s hit a locked database, retry %d of %d', func.__qualname__, attempt + 1, retries)
+                time.sleep(delay * 2 ** attempt * random.uniform(0.5, 1.5))
+    return wrapper
@@ -0,0 +1,202 @@
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Sum
+
+from .jobs import enqueue, task
+from .models import (
+    LINE_TOTAL,
+    CategorySalesRollup,
+    OrderItem,
+    OrderStatusRollup,
+    Product,
+    ProductSalesRollup,
+)
+
+
+PERIODS = ('hour', 'day')
+
+
+def bucket_for(moment, period):
+    moment = moment.astimezone(dt_timezone.utc)
+    if period == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def order_lines(order_ids):
+    """Per-order, per-product units and revenue for the given orders in one query."""
+    return (
+        OrderItem.objects
+        .filter(order_id__in=order_ids)
+        .values('order_id', 'product_id', 'product__category_id')
+        .annotate(units=Sum('quantity'), revenue=Sum(LINE_TOTAL))
+        .order_by()
+    )
+
+
+class RollupDelta:
+    """Accumulates rollup increments in memory and applies them as upserts.
+
+    Every change to the rollup tables goes through here, whether it comes
+    from a single status transition or a backfill chunk, so incremental and
+    batch maintenance always agree.
+    """
+
+    def __init__(self):
+        self.products = defaultdict(lambda: [Decimal('0'), 0, 0])
+        self.categories = defaultdict(lambda: [Decimal('0'), 0, 0])
+        self.statuses = defaultdict(int)
+
+    def add_status(self, order_date, status, sign=1):
+        for period in PERIODS:
+            self.statuses[(period, bucket_for(order_date, period), status)] += sign
+
+    def add_sales(self, order_date, lines, sign=1):
+        """lines: dicts with product_id, product__category_id, units and revenue."""
+        categories = {}
+        for line in lines:
+            for period in PERIODS:
+                bucket = bucket_for(order_date, period)
+                totals = self.products[(period, bucket, line['product_id'])]
+                totals[0] += sign * line['revenue']
+                totals[1] += sign * line['units']
+                totals[2] += sign
+            category_id = line['product__category_id']
+            if category_id is not None:
+                revenue, units = categories.get(category_id, (Decimal('0'), 0))
+                categories[category_id] = (revenue + line['revenue'], units + line['units'])
+
+        for category_id, (revenue, units) in categories.items():
+            for period in PERIODS:
+                totals = self.categories[(period, bucket_for(order_date, period), category_id)]
+                totals[0] += sign * revenue
+                totals[1] += sign * units
+                totals[2] += sign
+
+    def apply(self):
+        _increment(
+            ProductSalesRollup, ['period', 'bucket', 'product_id'], ['revenue', 'units', 'order_count'],
+            [key + tuple(totals) for key, totals in self.products.items() if any(totals)],
+        )
+        _increment(
+            CategorySalesRollup, ['period', 'bucket', 'category_id'], ['revenue', 'units', 'order_count'],
+            [key + tuple(totals) for key, totals in self.categories.items() if any(totals)],
+        )
+        _increment(
+            OrderStatusRollup, ['period', 'bucket', 'status'], ['order_count'],
+            [key + (count,) for key, count in self.statuses.items() if count],
+        )
+
+
+def _increment(model, key_columns, counter_columns, rows):
+    """INSERT ... ON CONFLICT DO UPDATE adding to the existing counters."""
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    columns = key_columns + counter_columns
+    sql = (
+        f"INSERT INTO {table} ({', '.join(qn(c) for c in columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({', '.join(qn(c) for c in key_columns)}) DO UPDATE SET "
+        + ', '.join(f"{qn(c)} = {table}.{qn(c)} + excluded.{qn(c)}" for c in counter_columns)
+    )
+    bucket_index = columns.index('bucket')
+    params = []
+    for row in rows:
+        row = list(row)
+        row[bucket_index] = connection.ops.adapt_datetimefield_value(row[bucket_index])
+        params.append(row)
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def queue_status_change(order, old_status):
+    """Fold one order's creation or status transition into the rollups from a background job.
+
+    The order's lines are read now, in the transaction that changes its
+    status, so the job applies the same delta however late it runs.
+    """
+    enqueue('rollups.status_change', {
+        'order_date': order.order_date.isoformat(),
+        'status': order.status,
+        'old_status': old_status,
+        'lines': [{**line, 'revenue': str(line['revenue'])} for line in _changed_lines(order, old_status)],
+    })
+
+
+@task('rollups.status_change')
+def apply_queued_status_change(order_date, status, old_status, lines):
+    lines = [{**line, 'revenue': Decimal(line['revenue'])} for line in lines]
+    _apply_status_change(datetime.fromisoformat(order_date), status, old_status, lines)
+
+
+def _changed_lines(order, old_status):
+    """The order's lines when the transition moves it into or out of 'completed'."""
+    if (old_status == 'completed') == (order.status == 'completed'):
+        return []
+    return list(order_lines([order.pk]))
+
+
+def _apply_status_change(order_date, status, old_status, lines):
+    delta = RollupDelta()
+    if old_status is not None:
+        delta.add_status(order_date, old_status, -1)
+    delta.add_status(order_date, status, 1)
+    if lines:
+        delta.add_sales(order_date, lines, 1 if status == 'completed' else -1)
+    delta.apply()
+
+
+def record_line_change(order, old_line, new_line):
+    """Fold an item added to, edited on or removed from a completed order into the sales rollups.
+
+    The order's lines are taken back out as they were before the change and
+    put in again as they are now, so per-product order counts stay right
+    when a product joins or leaves the order.
+    """
+    after = {line['product_id']: dict(line) for line in order_lines([order.pk])}
+    before = {product_id: dict(line) for product_id, line in after.items()}
+    for line, sign in ((new_line, -1), (old_line, 1)):
+        if line is None:
+            continue
+        product_id, quantity, unit_price = line
+        if product_id not in before:
+            category_id = Product.objects.filter(pk=product_id).values_list('category_id', flat=True).first()
+            before[product_id] = {
+                'product_id': product_id, 'product__category_id': category_id,
+                'units': 0, 'revenue': Decimal('0'),
+            }
+        before[product_id]['units'] += sign * quantity
+        before[product_id]['revenue'] += sign * quantity * unit_price
+
+    delta = RollupDelta()
+    delta.add_sales(order.order_date, [line for line in before.values() if line['units']], -1)
+    delta.add_sales(order.order_date, list(after.values()), 1)
+    delta.apply()
+
+
+def record_removed_order(order):
+    """Take an order that is about to be deleted back out of the rollups."""
+    delta = RollupDelta()
+    delta.add_status(order.order_date, order.status, -1)
+    if order.status == 'completed':
+        delta.add_sales(order.order_date, order_lines([order.pk]), -1)
+    delta.apply()
+
+
+def record_orders(orders, lines_by_order):
+    """Fold freshly inserted orders into the rollups in one pass.
+
+    lines_by_order maps order id to its order_lines()-shaped dicts, so bulk
+    writers that already know prices don't need to query them back.
+    """
+    delta = RollupDelta()
+    for order in orders:
+        delta.add_status(order.order_date, order.status)
+        if order.status == 'completed':
+            delta.add_sales(order.order_date, lines_by_order.get(order.pk, []))
+    delta.apply()
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+# Two SQLite databases stand in for read replicas in the routing tests
+TEST_REPLICAS = ('replica_a', 'replica_b')
+
+
+class TestRunner(DiscoverRunner):
+    """The default runner, plus the TEST_REPLICAS aliases with their own test databases."""
+
+    def setup_databases(self, **kwargs):
+        replicas = connections.configure_settings({
+            'default': connections.settings['default'],
+            **{
+                alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': settings.BASE_DIR / f'{alias}.sqlite3'}
+                for alias in TEST_REPLICAS
+            },
+        })
+        for alias in TEST_REPLICAS:
+            connections.settings[alias] = replicas[alias]
+        return super().setup_databases(**kwargs)
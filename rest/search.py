@@ -0,0 +1,126 @@
+"""Full-text product search.
+
+The backend is chosen with ``PRODUCT_SEARCH_BACKEND``. SQLiteFTSBackend
+keeps an FTS5 table (``rest_product_search``, created by migration 0004)
+in step with Product saves and deletes through rest.signals. Writes that
+skip signals (``bulk_create``, ``update()``, the benchmark seeding) are
+caught up with ``manage.py rebuild_search_index``. LikeBackend needs no
+index and works on any database, at the cost of scanning the table.
+"""
+import re
+from threading import Lock
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.module_loading import import_string
+
+from .models import Product, ProductSearchEntry
+
+# Terms beyond this are ignored rather than building a huge MATCH expression
+MAX_TERMS = 8
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+class SearchBackend:
+    """Interface of a product search backend."""
+
+    def search(self, queryset, query):
+        """``queryset`` narrowed to products matching every term of ``query``, best first.
+
+        Each term also matches as a prefix, so a partly typed word finds
+        its completions.
+        """
+        raise NotImplementedError
+
+    def update(self, products):
+        """Index ``products`` after they were saved."""
+
+    def remove(self, ids):
+        """Drop the products with these ids from the index."""
+
+    def rebuild(self):
+        """Reindex the whole catalog."""
+
+
+class LikeBackend(SearchBackend):
+    """Substring matching on name and description, name prefixes first."""
+
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return queryset.none()
+        matches = Q()
+        for term in terms:
+            matches &= Q(name__icontains=term) | Q(description__icontains=term)
+        leading = Case(
+            When(name__istartswith=terms[0], then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+        return queryset.filter(matches).order_by(leading, 'name', 'id')
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """SQLite FTS5 index over product name and description, ranked by bm25.
+
+    The rank weighs a name hit ten times a description hit (configured on
+    the table by the migration).
+    """
+
+    table = ProductSearchEntry._meta.db_table
+
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return queryset.none()
+        # Quoted so FTS5 operators in user input are taken literally
+        expression = ' '.join(f'"{term}"*' for term in terms)
+        return queryset.filter(search_entry__document__match=expression).order_by('search_entry__rank', 'id')
+
+    def update(self, products):
+        rows = [(product.pk, product.name, product.description or '') for product in products]
+        with self._cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [row[:1] for row in rows])
+            cursor.executemany(f'INSERT INTO {self.table} (rowid, name, description) VALUES (%s, %s, %s)', rows)
+
+    def remove(self, ids):
+        with self._cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in ids])
+
+    def rebuild(self):
+        using = router.db_for_write(Product)
+        with transaction.atomic(using=using), self._cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, description) '
+                f"SELECT id, name, COALESCE(description, '') FROM {Product._meta.db_table}"
+            )
+        with self._cursor() as cursor:
+            # Merge the index b-trees left by the bulk insert
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+
+    def _cursor(self):
+        return connections[router.db_for_write(Product)].cursor()
+
+
+_backend = None
+_backend_lock = Lock()
+
+
+def get_search_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'rest.search.SQLiteFTSBackend')
+            _backend = import_string(path)()
+        return _backend
+
+
+def reset_search_backend():
+    global _backend
+    with _backend_lock:
+        _backend = None
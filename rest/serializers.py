@@ -21,13 +21,35 @@ class ProductSerializer(serializers.ModelSerializer):
             'category', 
             'category_name',
             'is_available', 
+            'stock',
             'preparation_time',
             'created_at',
             'updated_at'
         ]
         extra_kwargs = {
-            'category': {'write_only': True}
+            'category': {'write_only': True},
+            'stock': {'write_only': True}
         }
+
+
+MAX_AVAILABILITY_IDS = 500
+
+
+class ProductAvailabilitySerializer(serializers.ModelSerializer):
+    product_id = serializers.IntegerField(source='id', read_only=True)
+    product_name = serializers.CharField(source='name', read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['product_id', 'product_name', 'is_available', 'price', 'preparation_time']
+
+
+class AvailabilityCheckSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_AVAILABILITY_IDS,
+    )
         
 
 
@@ -45,10 +67,44 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = '__all__'
+        # Maintained from the order's items by Order.update_total/adjust_total
+        read_only_fields = ['total_amount']
+
+# Orders nested in each customer row; the rest are paged at /customers/<id>/orders/
+RECENT_ORDERS = 5
+
 
 class CustomerSerializer(serializers.ModelSerializer):
-    orders = OrderSerializer(many=True, read_only=True, source='order_set')
+    order_count = serializers.SerializerMethodField()
+    orders = serializers.SerializerMethodField()
 
     class Meta:
         model = Customer
-        fields = ['id', 'user', 'phone', 'address', 'orders']
+        fields = ['id', 'user', 'phone', 'address', 'order_count', 'orders']
+
+    def get_order_count(self, customer):
+        # Annotated by CustomerViewSet.get_queryset
+        count = getattr(customer, 'order_count', None)
+        return customer.orders.count() if count is None else count
+
+    def get_orders(self, customer):
+        # Prefetched, newest RECENT_ORDERS per customer, by CustomerViewSet.get_queryset
+        orders = getattr(customer, 'recent_orders', None)
+        if orders is None:
+            orders = customer.orders.all()[:RECENT_ORDERS]
+        return OrderSerializer(orders, many=True).data
+
+
+class BatchOrderItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class BatchOrderSerializer(serializers.ModelSerializer):
+    items = BatchOrderItemSerializer(many=True, allow_empty=False)
+    # A plain id: create_order_batch checks all accounts with one query
+    customer_account = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+
+    class Meta:
+        model = Order
+        fields = ['customer', 'customer_account', 'status', 'notess', 'items']
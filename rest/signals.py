@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .authentication import user_cache
+from .catalog import bump_catalog_version
+from .events import publish_on_commit
+from .kitchen import loaded_scheduler
+from .models import (
+    Category, Order, OrderItem, Product, User, order_line_changed, order_status_changed, order_total_changed,
+)
+from .receipts import queue_receipt
+from .rollups import queue_status_change, record_line_change, record_removed_order
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_catalog(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'name', 'description'} & set(update_fields):
+        return
+    get_search_backend().update([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_cached_user(sender, instance, **kwargs):
+    # Again after commit, in case a request cached the old row in between
+    user_cache.invalidate(instance.pk)
+    transaction.on_commit(lambda: user_cache.invalidate(instance.pk))
+
+
+@receiver(order_status_changed, sender=Order)
+def update_rollups(sender, order, old_status, **kwargs):
+    queue_status_change(order, old_status)
+
+
+@receiver(order_status_changed, sender=Order)
+def send_receipt_on_completion(sender, order, **kwargs):
+    if order.status == 'completed':
+        queue_receipt(order)
+
+
+@receiver(order_line_changed, sender=OrderItem)
+def update_sales_rollups(sender, order, old_line, new_line, **kwargs):
+    if order.status == 'completed':
+        record_line_change(order, old_line, new_line)
+
+
+@receiver(pre_delete, sender=Order)
+def remove_from_rollups(sender, instance, **kwargs):
+    record_removed_order(instance)
+
+
+@receiver(pre_delete, sender=Order)
+def release_deleted_order_stock(sender, instance, **kwargs):
+    # Items are deleted by the cascade, which never calls OrderItem.delete();
+    # completed orders used their stock and canceled ones already gave it back.
+    if instance.status not in ('canceled', 'completed'):
+        instance._release_stock()
+
+
+@receiver(order_status_changed, sender=Order)
+def update_kitchen_queue(sender, order, old_status, created, **kwargs):
+    scheduler = loaded_scheduler()
+    if scheduler is None or created:
+        return
+    pending = order.status == 'pending'
+
+    def apply():
+        scheduler.remove_order(order.pk)
+        if pending:
+            items = order.order_items.values_list('id', 'product__preparation_time')
+            scheduler.add_order(order.pk, order.order_date, items)
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def update_kitchen_task(sender, instance, signal, **kwargs):
+    scheduler = loaded_scheduler()
+    if scheduler is None:
+        return
+    order_id, item_id = instance.order_id, instance.pk
+    task = None
+    if signal is post_save and instance.order.status == 'pending':
+        task = (instance.order.order_date, instance.product.preparation_time)
+
+    def apply():
+        scheduler.remove_task(order_id, item_id)
+        if task:
+            scheduler.add_task(order_id, task[0], item_id, task[1])
+
+    transaction.on_commit(apply)
+
+
+@receiver(order_status_changed, sender=Order)
+def publish_status_event(sender, order, old_status, created, **kwargs):
+    if created:
+        publish_on_commit('created', order=order)
+    else:
+        publish_on_commit('status_changed', order=order, old_status=old_status)
+
+
+@receiver(order_total_changed, sender=Order)
+def publish_total_event(sender, order, order_id, delta, **kwargs):
+    publish_on_commit('total_changed', order=order, order_id=order_id, delta=f'{delta:.2f}')
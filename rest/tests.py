@@ -330,42 +330,1788 @@ class ProductAPITestCase(APITestCase):
         self.assertEqual(response.data['results'][0]['name'], "Tea")
         self.assertEqual(response.data['results'][1]['name'], "Coffee")  
 
-    def test_order_completion_updates_availability(self):
-        """Products should become unavailable when order is completed"""
-        self.client.force_authenticate(user=self.staff)
-        
-        # Create order
-        order_data = {
-            'customer': 'Test Customer',
-            'status': 'pending',
-            'order_items': [
-                {
-                    'product': self.product1.id,
-                    'quantity': 2
-                }
-            ]
+   
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+
+class MenuByCategoryTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='waiter', password='pass')
+        self.client.force_authenticate(user=self.user)
+        self.drinks = Category.objects.create(name="Drinks", description="Cold and hot")
+        self.mains = Category.objects.create(name="Mains", description="Main dishes")
+        self.closed = Category.objects.create(name="Closed", description="Hidden", is_active=False)
+        self.empty = Category.objects.create(name="Empty", description="Sold out")
+        self.tea = Product.objects.create(name="Tea", price=2.50, category=self.drinks)
+        self.coffee = Product.objects.create(name="Coffee", price=3.50, category=self.drinks)
+        self.steak = Product.objects.create(name="Steak", price=20, category=self.mains)
+        Product.objects.create(name="Secret", price=1, category=self.closed)
+        Product.objects.create(name="Gone", price=1, category=self.empty, is_available=False)
+        self.menu_url = reverse('product-menu-by-category')
+
+    def test_menu_groups_available_products(self):
+        response = self.client.get(self.menu_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c['category_name'] for c in response.data], ["Drinks", "Mains"])
+        self.assertEqual([p['name'] for p in response.data[0]['products']], ["Coffee", "Tea"])
+        self.assertEqual(response.data[0]['products'][0]['category_name'], "Drinks")
+
+    def test_menu_is_built_in_one_query_and_cached(self):
+        with self.assertNumQueries(1):
+            self.client.get(self.menu_url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.menu_url)
+        self.assertEqual(len(response.data), 2)
+
+    def test_product_and_category_writes_invalidate_menu(self):
+        self.client.get(self.menu_url)
+        self.steak.is_available = False
+        self.steak.save()
+        response = self.client.get(self.menu_url)
+        self.assertEqual([c['category_name'] for c in response.data], ["Drinks"])
+
+        self.drinks.delete()
+        response = self.client.get(self.menu_url)
+        self.assertEqual(response.data, [])
+
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from .exceptions import OutOfStock
+
+
+class OrderStockReservationTestCase(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name="Mains", description="Main dishes")
+
+    def _order_with_items(self, count, stock=10, quantity=1):
+        order = Order.objects.create(customer="Table 4", status='pending')
+        for i in range(count):
+            product = Product.objects.create(name=f"Dish {i}", price=10, category=self.category, stock=stock)
+            OrderItem.objects.create(order=order, product=product, quantity=quantity)
+        return order
+
+    def _count_transition_queries(self, order, status):
+        order.status = status
+        with CaptureQueriesContext(connection) as ctx:
+            order.save()
+        return len(ctx.captured_queries)
+
+    def test_items_reserve_and_cancel_releases(self):
+        order = self._order_with_items(3, stock=5, quantity=2)
+        self.assertEqual(list(Product.objects.values_list('stock', flat=True)), [3, 3, 3])
+
+        order.status = 'completed'
+        order.save()
+        self.assertEqual(list(Product.objects.values_list('stock', flat=True)), [3, 3, 3])
+
+        order.status = 'canceled'
+        order.save()
+        self.assertEqual(list(Product.objects.values_list('stock', flat=True)), [5, 5, 5])
+
+        order.status = 'pending'
+        order.save()
+        self.assertEqual(list(Product.objects.values_list('stock', flat=True)), [3, 3, 3])
+
+    def test_deleting_a_live_order_releases_its_stock(self):
+        pending = self._order_with_items(2, stock=5, quantity=2)
+        pending.delete()
+        self.assertEqual(list(Product.objects.values_list('stock', flat=True)), [5, 5])
+
+        completed = self._order_with_items(1, stock=5, quantity=2)
+        completed.status = 'completed'
+        completed.save()
+        canceled = self._order_with_items(1, stock=5, quantity=2)
+        canceled.status = 'canceled'
+        canceled.save()
+        Order.objects.filter(pk__in=[completed.pk, canceled.pk]).delete()
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('stock', flat=True)), [5, 5, 3, 5],
+        )
+
+    def test_availability_follows_remaining_stock(self):
+        order = self._order_with_items(1, stock=2, quantity=2)
+        product = Product.objects.get()
+        self.assertEqual((product.stock, product.is_available), (0, False))
+
+        order.status = 'canceled'
+        order.save()
+        product.refresh_from_db()
+        self.assertEqual((product.stock, product.is_available), (2, True))
+
+    def test_overselling_is_refused(self):
+        order = self._order_with_items(1, stock=1)
+        product = Product.objects.get()
+        with self.assertRaises(OutOfStock):
+            OrderItem.objects.create(order=order, product=product)
+        self.assertEqual(order.order_items.count(), 1)
+
+        other = self._order_with_items(1, stock=1)
+        order.status = 'canceled'
+        order.save()
+        OrderItem.objects.create(order=other, product=product)
+        order.status = 'pending'
+        with self.assertRaises(OutOfStock):
+            order.save()
+
+    def test_untracked_products_are_left_alone(self):
+        order = self._order_with_items(2, stock=None, quantity=50)
+        order.status = 'canceled'
+        order.save()
+        self.assertEqual(Product.objects.filter(stock=None, is_available=True).count(), 2)
+
+    def test_transition_query_count_is_constant(self):
+        small = self._order_with_items(1)
+        large = self._order_with_items(12)
+        self.assertEqual(
+            self._count_transition_queries(small, 'canceled'),
+            self._count_transition_queries(large, 'canceled'),
+        )
+        self.assertEqual(
+            self._count_transition_queries(small, 'pending'),
+            self._count_transition_queries(large, 'pending'),
+        )
+
+    def test_save_without_status_change_skips_products(self):
+        order = self._order_with_items(5)
+        order.notess = "No onions"
+        with CaptureQueriesContext(connection) as ctx:
+            order.save()
+        self.assertFalse(any('"rest_product"' in q['sql'] for q in ctx.captured_queries))
+
+
+import threading
+from django.db import OperationalError, close_old_connections
+from django.test import TransactionTestCase
+
+
+class StockConcurrencyTestCase(TransactionTestCase):
+    """Many threads ordering the same dish must never oversell it."""
+
+    def test_concurrent_orders_never_oversell(self):
+        category = Category.objects.create(name="Specials", description="Limited")
+        product = Product.objects.create(name="Truffle Pasta", price=30, category=category, stock=25)
+        placed, refused = [], []
+
+        def place_orders():
+            try:
+                for _ in range(10):
+                    while True:
+                        try:
+                            with transaction.atomic():
+                                order = Order.objects.create(customer="Rush", status='pending')
+                                OrderItem.objects.create(order=order, product=product)
+                            placed.append(order.pk)
+                        except OutOfStock:
+                            refused.append(1)
+                        except OperationalError:
+                            continue  # SQLite lock contention, retry the whole order
+                        break
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=place_orders) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(len(placed), 25)
+        self.assertEqual(len(refused), 80 - 25)
+        self.assertEqual(product.stock, 0)
+        self.assertFalse(product.is_available)
+        self.assertEqual(OrderItem.objects.count(), 25)
+
+
+from decimal import Decimal
+from django.core.management import call_command
+from io import StringIO
+
+
+class OrderTotalTestCase(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name="Mains", description="Main dishes")
+        self.burger = Product.objects.create(name="Burger", price=Decimal('9.50'), category=self.category)
+        self.fries = Product.objects.create(name="Fries", price=Decimal('3.25'), category=self.category)
+        self.order = Order.objects.create(customer="Table 2", status='pending')
+
+    def _stored_total(self):
+        return Order.objects.get(pk=self.order.pk).total_amount
+
+    def test_items_maintain_total_incrementally(self):
+        item = OrderItem.objects.create(order=self.order, product=self.burger, quantity=2)
+        OrderItem.objects.create(order=self.order, product=self.fries)
+        self.assertEqual(self._stored_total(), Decimal('22.25'))
+        self.assertEqual(self.order.total_amount, Decimal('22.25'))
+
+        item.quantity = 1
+        item.save()
+        self.assertEqual(self._stored_total(), Decimal('12.75'))
+
+        item = OrderItem.objects.get(pk=item.pk)
+        item.product = self.fries
+        item.save()
+        self.assertEqual(self._stored_total(), Decimal('6.50'))
+
+        item.delete()
+        self.assertEqual(self._stored_total(), Decimal('3.25'))
+
+    def test_lines_keep_the_price_they_were_added_at(self):
+        item = OrderItem.objects.create(order=self.order, product=self.burger, quantity=2)
+        Product.objects.filter(pk=self.burger.pk).update(price=Decimal('12.00'))
+        item = OrderItem.objects.get(pk=item.pk)
+        item.quantity = 3
+        item.save()
+        self.assertEqual(self._stored_total(), Decimal('28.50'))
+        OrderItem.objects.create(order=self.order, product=Product.objects.get(pk=self.burger.pk))
+        self.assertEqual(self._stored_total(), Decimal('40.50'))
+
+        item.delete()
+        self.assertEqual(self._stored_total(), Decimal('12.00'))
+        self.order.update_total()
+        self.assertEqual(self._stored_total(), Decimal('12.00'))
+
+    def test_saving_a_stale_order_keeps_the_stored_total(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        OrderItem.objects.create(order_id=self.order.pk, product=self.burger, quantity=2)
+        stale.status = 'completed'
+        stale.save()
+        self.assertEqual(self._stored_total(), Decimal('19.00'))
+
+    def test_empty_update_fields_saves_nothing(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.customer = "Renamed"
+        order.status = 'canceled'
+        order.save(update_fields=[])
+        stored = Order.objects.get(pk=self.order.pk)
+        self.assertEqual((stored.customer, stored.status), ("Table 2", 'pending'))
+        order.save(update_fields=['customer'])
+        stored = Order.objects.get(pk=self.order.pk)
+        self.assertEqual((stored.customer, stored.status), ("Renamed", 'pending'))
+
+    def test_update_total_uses_single_aggregate(self):
+        for _ in range(5):
+            OrderItem.objects.create(order=self.order, product=self.burger)
+        Order.objects.filter(pk=self.order.pk).update(total_amount=0)
+        with self.assertNumQueries(2):
+            self.order.update_total()
+        self.assertEqual(self._stored_total(), Decimal('47.50'))
+
+    def test_recompute_command_fixes_stale_totals(self):
+        OrderItem.objects.create(order=self.order, product=self.burger, quantity=3)
+        empty = Order.objects.create(customer="Table 3", status='pending')
+        Order.objects.update(total_amount=99)
+        out = StringIO()
+        call_command('recompute_order_totals', chunk_size=1, stdout=out)
+        self.assertEqual(self._stored_total(), Decimal('28.50'))
+        self.assertEqual(Order.objects.get(pk=empty.pk).total_amount, 0)
+        self.assertIn("2 updated", out.getvalue())
+
+
+class OrderBatchCreateTestCase(APITestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name="Mains", description="Main dishes")
+        self.burger = Product.objects.create(name="Burger", price=Decimal('9.50'), category=category)
+        self.fries = Product.objects.create(name="Fries", price=Decimal('3.25'), category=category)
+        self.url = reverse('order-batch-create')
+
+    def _payload(self, count):
+        return [
+            {
+                'customer': f"Table {i}",
+                'status': 'pending',
+                'items': [
+                    {'product': self.burger.id, 'quantity': 2},
+                    {'product': self.fries.id},
+                ],
+            }
+            for i in range(count)
+        ]
+
+    def test_batch_creates_orders_items_and_totals(self):
+        response = self.client.post(self.url, self._payload(3), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(OrderItem.objects.count(), 6)
+        for result in response.data['results']:
+            self.assertEqual(Order.objects.get(pk=result['id']).total_amount, Decimal('22.25'))
+
+    def test_batch_query_count_is_constant(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(self.url, self._payload(2), format='json')
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(self.url, self._payload(100), format='json')
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_batch_reports_invalid_orders(self):
+        payload = self._payload(2)
+        payload[0]['items'][0]['product'] = 999999
+        payload.append({'customer': "Table 9", 'status': 'pending', 'items': []})
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(
+            [r['status'] for r in response.data['results']],
+            ['invalid', 'created', 'invalid'],
+        )
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_batch_rejects_non_list_payload(self):
+        response = self.client.post(self.url, {'customer': "Table 1"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class OrderKeysetPaginationTestCase(APITestCase):
+
+    def setUp(self):
+        Order.objects.bulk_create([Order(customer=f"Table {i}", status='pending') for i in range(12)])
+        self.url = reverse('order-list')
+
+    def test_cursor_walks_all_orders_newest_first(self):
+        seen = []
+        url = self.url + '?cursor=&page_size=5'
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            self.assertFalse(any('COUNT(' in q['sql'] for q in ctx.captured_queries))
+            seen.extend(order['id'] for order in response.data['results'])
+            url = response.data['next']
+        expected = list(Order.objects.order_by('-order_date', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_page_size_is_capped(self):
+        Order.objects.bulk_create([Order(customer="Bar", status='pending') for _ in range(150)])
+        response = self.client.get(self.url, {'cursor': '', 'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 100)
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_number_mode_is_unchanged(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(len(response.data['results']), 5)
+
+
+import unittest
+from .views import ProductFilter
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+class QueryPlanTestCase(TestCase):
+    """Guard the hot filter paths against silently falling back to full table scans."""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create([
+            Category(name=f"Category {i}", description="Seeded") for i in range(20)
+        ])
+        Product.objects.bulk_create([
+            Product(
+                name=f"Product {i}",
+                price=Decimal(i % 50) + Decimal('0.99'),
+                category=categories[i % 20],
+                is_available=i % 3 != 0,
+            )
+            for i in range(5000)
+        ])
+        Order.objects.bulk_create([
+            Order(customer=f"Customer {i % 500}", status=('pending', 'completed', 'canceled')[i % 3])
+            for i in range(10000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertSearchesIndex(self, queryset, index_name):
+        """The filter must seek into the index, not scan a table or a whole index."""
+        plan = queryset.explain()
+        self.assertRegex(plan, rf'SEARCH rest_\w+ USING (COVERING )?INDEX {index_name}\b')
+        return plan
+
+    def assertScansInIndexOrder(self, queryset, index_name):
+        """An unfiltered listing may scan, but only along the index that provides its ordering."""
+        plan = queryset.explain()
+        self.assertRegex(plan, rf'SCAN rest_\w+ USING (COVERING )?INDEX {index_name}\b')
+        self.assertNotIn('TEMP B-TREE', plan)
+        return plan
+
+    def test_order_status_filter(self):
+        plan = self.assertSearchesIndex(Order.objects.filter(status='completed'), 'order_status_date_idx')
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_order_customer_filter(self):
+        plan = self.assertSearchesIndex(Order.objects.filter(customer='Customer 7'), 'order_customer_date_idx')
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_order_history_ordering(self):
+        self.assertScansInIndexOrder(Order.objects.all()[:5], 'order_date_id_idx')
+
+    def test_product_listing_ordering(self):
+        self.assertScansInIndexOrder(Product.objects.all()[:5], 'product_created_id_idx')
+
+    def test_product_filter_availability_category_price(self):
+        category = Category.objects.first()
+        data = {'is_available': True, 'category': category.id, 'price_gte': 10, 'price_lt': 20}
+        self.assertSearchesIndex(
+            ProductFilter(data, queryset=Product.objects.all()).qs,
+            'product_avail_cat_price_idx',
+        )
+
+    def test_product_filter_price_range(self):
+        data = {'price_gt': 45, 'price_lte': 48}
+        self.assertSearchesIndex(ProductFilter(data, queryset=Product.objects.all()).qs, 'product_price_idx')
+
+
+import csv
+import json
+import time
+from datetime import timedelta
+from django.utils import timezone
+from .export import iter_orders
+
+
+class OrderExportTestCase(APITestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name="Mains", description="Main dishes")
+        self.burger = Product.objects.create(name="Burger", price=Decimal('9.50'), category=category)
+        self.paid = Order.objects.create(customer="Alice", status='completed')
+        OrderItem.objects.create(order=self.paid, product=self.burger, quantity=2)
+        self.open = Order.objects.create(customer="Bob", status='pending')
+        self.url = reverse('order-export')
+
+    def _content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_streams_items(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(self._content(response).splitlines()))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['product_name'], "Burger")
+        self.assertEqual(rows[0]['line_total'], "19.00")
+        self.assertEqual(rows[1]['customer'], "Bob")
+        self.assertEqual(rows[1]['product_id'], "")
+
+    def test_ndjson_export_respects_filters(self):
+        response = self.client.get(self.url, {'export_format': 'ndjson', 'status': 'completed'})
+        lines = self._content(response).splitlines()
+        self.assertEqual(len(lines), 1)
+        order = json.loads(lines[0])
+        self.assertEqual(order['total_amount'], "19.00")
+        self.assertEqual(order['items'][0]['unit_price'], "9.50")
+
+    def test_date_range(self):
+        tomorrow = (timezone.now() + timedelta(days=1)).date().isoformat()
+        response = self.client.get(self.url, {'export_format': 'ndjson', 'date_from': tomorrow})
+        self.assertEqual(self._content(response), '')
+        response = self.client.get(self.url, {'date_to': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_date_to_includes_that_day(self):
+        today = timezone.now().date()
+        response = self.client.get(self.url, {'export_format': 'ndjson', 'date_to': today.isoformat()})
+        self.assertEqual(len(self._content(response).splitlines()), 2)
+        yesterday = (today - timedelta(days=1)).isoformat()
+        response = self.client.get(self.url, {'export_format': 'ndjson', 'date_to': yesterday})
+        self.assertEqual(self._content(response), '')
+
+    def test_export_reads_in_chunks(self):
+        with CaptureQueriesContext(connection) as ctx:
+            orders = list(iter_orders(Order.objects.all(), chunk_size=1))
+        self.assertEqual([o['id'] for o in orders], [self.paid.id, self.open.id])
+        self.assertEqual(len(ctx.captured_queries), 5)
+
+
+from unittest import mock
+
+from .jobs import run_pending
+from .models import CategorySalesRollup, OrderStatusRollup, ProductSalesRollup
+
+
+class SalesRollupTestCase(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(user=get_user_model().objects.create_user(username='boss', password='pass'))
+        self.mains = Category.objects.create(name="Mains", description="Main dishes")
+        self.burger = Product.objects.create(name="Burger", price=Decimal('9.50'), category=self.mains)
+        self.fries = Product.objects.create(name="Fries", price=Decimal('3.25'), category=self.mains)
+
+    def _order(self, status='pending'):
+        order = Order.objects.create(customer="Table 1", status='pending')
+        OrderItem.objects.create(order=order, product=self.burger, quantity=2)
+        OrderItem.objects.create(order=order, product=self.fries)
+        if status != 'pending':
+            order.status = status
+            order.save()
+        run_pending()
+        return order
+
+    def _snapshot(self):
+        return (
+            sorted(ProductSalesRollup.objects.exclude(units=0, order_count=0).values_list(
+                'period', 'bucket', 'product_id', 'revenue', 'units', 'order_count')),
+            sorted(CategorySalesRollup.objects.exclude(units=0, order_count=0).values_list(
+                'period', 'bucket', 'category_id', 'revenue', 'units', 'order_count')),
+            sorted(OrderStatusRollup.objects.exclude(order_count=0).values_list(
+                'period', 'bucket', 'status', 'order_count')),
+        )
+
+    def test_completion_and_cancel_update_rollups(self):
+        order = self._order('completed')
+        self._order('pending')
+        burger = ProductSalesRollup.objects.get(period='day', product=self.burger)
+        self.assertEqual((burger.revenue, burger.units, burger.order_count), (Decimal('19.00'), 2, 1))
+        mains = CategorySalesRollup.objects.get(period='hour', category=self.mains)
+        self.assertEqual((mains.revenue, mains.units, mains.order_count), (Decimal('22.25'), 3, 1))
+
+        order.status = 'canceled'
+        order.save()
+        run_pending()
+        burger.refresh_from_db()
+        self.assertEqual((burger.revenue, burger.units, burger.order_count), (Decimal('0.00'), 0, 0))
+        counts = dict(OrderStatusRollup.objects.filter(period='day').values_list('status', 'order_count'))
+        self.assertEqual(counts, {'pending': 1, 'completed': 0, 'canceled': 1})
+
+    def test_backfill_matches_incremental_rollups(self):
+        self._order('completed')
+        self._order('completed')
+        self._order('canceled')
+        self.client.post(reverse('order-batch-create'), [
+            {'customer': "Bar", 'status': 'completed', 'items': [{'product': self.fries.id, 'quantity': 4}]},
+        ], format='json')
+        incremental = self._snapshot()
+        call_command('backfill_rollups', chunk_size=2, stdout=StringIO())
+        self.assertEqual(self._snapshot(), incremental)
+
+    def test_item_edits_on_completed_orders_match_backfill(self):
+        order = self._order('completed')
+        Product.objects.filter(pk=self.burger.pk).update(price=Decimal('20.00'))
+        burger_line = order.order_items.get(product=self.burger)
+        burger_line.quantity = 3
+        burger_line.save()
+        soda = Product.objects.create(name="Soda", price=Decimal('2.00'), category=self.mains)
+        OrderItem.objects.create(order=order, product=soda)
+        order.order_items.get(product=self.fries).delete()
+        run_pending()
+        incremental = self._snapshot()
+        burger = ProductSalesRollup.objects.get(period='day', product=self.burger)
+        self.assertEqual((burger.revenue, burger.units, burger.order_count), (Decimal('28.50'), 3, 1))
+        call_command('backfill_rollups', stdout=StringIO())
+        self.assertEqual(self._snapshot(), incremental)
+
+        order = Order.objects.get(pk=order.pk)
+        order.status = 'canceled'
+        order.save()
+        run_pending()
+        self.assertEqual(self._snapshot()[:2], ([], []))
+
+    def test_analytics_endpoints_read_rollups(self):
+        self._order('completed')
+        self._order('pending')
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('analytics-summary'))
+        self.assertEqual(response.data['revenue'], "22.25")
+        self.assertEqual(response.data['units'], 3)
+        self.assertEqual(response.data['orders_by_status'], {'completed': 1, 'pending': 1})
+
+        response = self.client.get(reverse('analytics-categories'), {'period': 'hour'})
+        self.assertEqual(response.data[0]['category_name'], "Mains")
+        self.assertEqual(response.data[0]['revenue'], "22.25")
+        response = self.client.get(reverse('analytics-products'), {'period': 'week'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_analytics_date_to_includes_that_day(self):
+        self._order('completed')
+        today = timezone.now().date()
+        response = self.client.get(reverse('analytics-products'), {'date_from': today, 'date_to': today})
+        self.assertEqual([row['product_name'] for row in response.data], ["Burger", "Fries"])
+        response = self.client.get(reverse('analytics-products'), {'date_to': today - timedelta(days=1)})
+        self.assertEqual(response.data, [])
+
+    def test_analytics_id_filters_are_validated(self):
+        self._order('completed')
+        response = self.client.get(reverse('analytics-products'), {'product': self.fries.pk})
+        self.assertEqual({row['product_name'] for row in response.data}, {"Fries"})
+        response = self.client.get(reverse('analytics-products'), {'product': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('analytics-categories'), {'category': '1.5'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_failed_backfill_leaves_rollups_untouched(self):
+        self._order('completed')
+        self._order('completed')
+        before = self._snapshot()
+        with mock.patch('rest.management.commands.backfill_rollups.RollupDelta.apply',
+                        side_effect=[None, RuntimeError]):
+            with self.assertRaises(RuntimeError):
+                call_command('backfill_rollups', chunk_size=1, stdout=StringIO())
+        self.assertEqual(self._snapshot(), before)
+
+
+import random
+from django.test import SimpleTestCase
+from .kitchen import KitchenScheduler, reset_scheduler
+
+
+class KitchenSchedulerTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def test_earliest_deadline_then_shortest_prep_first(self):
+        scheduler = KitchenScheduler(stations=1, now=self.now.timestamp())
+        scheduler.add_order(2, self.now + timedelta(minutes=5), [(20, 1)])
+        scheduler.add_order(1, self.now, [(10, 10), (11, 2)])
+        self.assertEqual([t['order_item_id'] for t in scheduler.plan_for(1)], [11, 10])
+        self.assertEqual(scheduler.estimated_ready_at(1), self.now + timedelta(minutes=12))
+        self.assertEqual(scheduler.estimated_ready_at(2), self.now + timedelta(minutes=13))
+        ready = {t['order_item_id']: t['ready_at'] for t in scheduler.plan_for(1)}
+        self.assertEqual(ready[11], self.now + timedelta(minutes=2))
+
+    def test_tasks_spread_over_stations(self):
+        scheduler = KitchenScheduler(stations=2, now=self.now.timestamp())
+        scheduler.add_order(1, self.now, [(1, 10), (2, 10), (3, 5)])
+        self.assertEqual(scheduler.estimated_ready_at(1), self.now + timedelta(minutes=15))
+        self.assertEqual({t['station'] for t in scheduler.plan_for(1)}, {0, 1})
+
+    def test_incremental_updates_match_full_replan(self):
+        rng = random.Random(7)
+        live = KitchenScheduler(stations=3, now=self.now.timestamp())
+        orders = {}
+        for order_id in range(200):
+            order_date = self.now + timedelta(seconds=rng.randint(0, 3600))
+            orders[order_id] = (order_date, [(order_id * 10 + n, rng.randint(1, 20)) for n in range(3)])
+            live.add_order(order_id, *orders[order_id])
+        for order_id in rng.sample(sorted(orders), 60):
+            live.remove_order(order_id)
+            del orders[order_id]
+            # Reads in between plan only part of the queue
+            live.estimated_ready_at(rng.choice(sorted(orders)))
+        kept = min(orders)
+        removed_item, _ = orders[kept][1].pop(1)
+        live.remove_task(kept, removed_item)
+
+        fresh = KitchenScheduler(stations=3, now=self.now.timestamp())
+        for order_id, (order_date, items) in orders.items():
+            fresh.add_order(order_id, order_date, items)
+        for order_id in orders:
+            self.assertEqual(live.estimated_ready_at(order_id), fresh.estimated_ready_at(order_id))
+        self.assertIsNone(live.estimated_ready_at(max(set(range(200)) - orders.keys())))
+
+    def test_requeued_orders_replace_their_tasks(self):
+        scheduler = KitchenScheduler(stations=1, now=self.now.timestamp())
+        scheduler.add_order(1, self.now, [(10, 10), (11, 2)])
+        scheduler.add_order(1, self.now, [(10, 10), (11, 2)])
+        scheduler.add_task(1, self.now, 11, 3)
+        self.assertEqual(len(scheduler), 2)
+        self.assertEqual(scheduler.estimated_ready_at(1), self.now + timedelta(minutes=13))
+
+
+class OrderEtaTestCase(APITestCase):
+
+    def setUp(self):
+        reset_scheduler()
+        self.addCleanup(reset_scheduler)
+        category = Category.objects.create(name="Mains", description="Main dishes")
+        self.steak = Product.objects.create(name="Steak", price=20, category=category, preparation_time=25)
+        self.salad = Product.objects.create(name="Salad", price=8, category=category, preparation_time=5)
+
+    def test_eta_tracks_items_and_cancellation(self):
+        order = Order.objects.create(customer="Table 8", status='pending')
+        OrderItem.objects.create(order=order, product=self.salad)
+        url = reverse('order-eta', args=[order.id])
+
+        response = self.client.get(url)
+        first = response.data['estimated_ready_at']
+        self.assertEqual(len(response.data['tasks']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderItem.objects.create(order=order, product=self.steak)
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['tasks']), 2)
+        self.assertEqual(response.data['estimated_ready_at'] - first, timedelta(minutes=20))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'canceled'
+            order.save()
+        response = self.client.get(url)
+        self.assertIsNone(response.data['estimated_ready_at'])
+        self.assertEqual(response.data['tasks'], [])
+
+
+from rest_framework.renderers import JSONRenderer
+from .fast_serializers import fast_category_serializer, fast_order_serializer, fast_product_serializer
+from .serializers import CategorySerializer, OrderSerializer, ProductSerializer
+
+
+class FastSerializerTestCase(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(user=get_user_model().objects.create_user(username='tablet', password='pass'))
+        category = Category.objects.create(name="Drinks", description="Cold and hot")
+        Product.objects.create(name="Tea", price=Decimal('2.5'), category=category, description="Green")
+        Product.objects.create(name="Orphan", price=3, category=None, stock=4)
+        order = Order.objects.create(customer="Table 1", status='pending', notess="Extra ice")
+        OrderItem.objects.create(order=order, product=Product.objects.get(name="Tea"), quantity=3)
+
+    def assertSameJSON(self, fast, serializer_class, queryset):
+        render = JSONRenderer().render
+        self.assertEqual(
+            render(fast.many(fast.values(queryset))),
+            render(serializer_class(queryset, many=True).data),
+        )
+
+    def test_output_is_byte_identical(self):
+        self.assertSameJSON(fast_product_serializer, ProductSerializer, Product.objects.all())
+        self.assertSameJSON(fast_category_serializer, CategorySerializer, Category.objects.all())
+        self.assertSameJSON(fast_order_serializer, OrderSerializer, Order.objects.all())
+
+    def test_product_list_is_one_query_per_page(self):
+        Product.objects.bulk_create([Product(name=f"Dish {i}", price=5) for i in range(20)])
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('product-list'), {'cursor': '', 'page_size': 20})
+        self.assertEqual(len(response.data['results']), 20)
+        with self.assertNumQueries(2):
+            self.client.get(reverse('product-available-products'))
+
+
+import datetime as dt
+from io import BytesIO
+from rest_framework.exceptions import ParseError
+from .renderers import FastJSONParser, FastJSONRenderer, MessagePackParser, MessagePackRenderer, msgpack
+
+
+class RendererTestCase(APITestCase):
+
+    payload = {
+        'price': Decimal('12.50'),
+        'when': dt.datetime(2025, 3, 1, 18, 30, 5, 123456, tzinfo=dt.timezone.utc),
+        'day': dt.date(2025, 3, 1),
+        'name': "Crème brûlée   ☕",
+        'items': [1, 2.5, None, True],
+        'nested': {'ok': False},
+    }
+
+    def test_fast_json_matches_drf_json(self):
+        self.assertEqual(FastJSONRenderer().render(self.payload), JSONRenderer().render(self.payload))
+        self.assertEqual(
+            FastJSONRenderer().render(self.payload, 'application/json; indent=2'),
+            JSONRenderer().render(self.payload, 'application/json; indent=2'),
+        )
+
+    def test_fast_json_parser(self):
+        self.assertEqual(FastJSONParser().parse(BytesIO(b'{"a": [1, "x"]}')), {'a': [1, "x"]})
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(BytesIO(b'{"a": '))
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack_round_trip_and_negotiation(self):
+        body = MessagePackRenderer().render(self.payload)
+        data = MessagePackParser().parse(BytesIO(body))
+        self.assertEqual(data['price'], "12.50")
+        self.assertEqual(data['when'], json.loads(JSONRenderer().render(self.payload))['when'])
+
+        Category.objects.create(name="Drinks", description="Cold")
+        self.client.force_authenticate(user=get_user_model().objects.create_user(username='pos', password='pass'))
+        response = self.client.get(reverse('category-list'), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content)['results'][0]['name'], "Drinks")
+
+
+from django.utils.http import http_date
+
+from .catalog import CATALOG_VERSION_KEY
+from .checks import check_shared_cache
+
+
+class CatalogConditionalGetTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(username='tablet', password='pass'))
+        self.drinks = Category.objects.create(name="Drinks", description="Cold")
+        self.tea = Product.objects.create(name="Tea", price=2.50, category=self.drinks, stock=1)
+        self.urls = [
+            reverse('product-list'),
+            reverse('product-available-products'),
+            reverse('product-menu-by-category'),
+            reverse('category-list'),
+        ]
+
+    def test_matching_etag_returns_304_without_queries(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn('no-cache', response['Cache-Control'])
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response.content, b'')
+            self.assertTrue(response['ETag'])
+
+    def test_etag_depends_on_query_and_media_type(self):
+        url = reverse('product-list')
+        etags = {
+            self.client.get(url)['ETag'],
+            self.client.get(url, {'price_lt': 3})['ETag'],
+            self.client.get(url, HTTP_ACCEPT='application/msgpack')['ETag'],
         }
-        
-        # Create order (simplified - in reality you'd need nested serializer)
-        order = Order.objects.create(
-            customer=order_data['customer'],
-            status=order_data['status']
+        self.assertEqual(len(etags), 3)
+
+    def test_catalog_writes_change_etag(self):
+        url = reverse('product-available-products')
+        etag = self.client.get(url)['ETag']
+        self.tea.name = "Green tea"
+        self.tea.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['name'], "Green tea")
+
+        etag = response['ETag']
+        Product.objects.filter(pk=self.tea.pk).reserve(1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
+
+    def test_if_modified_since(self):
+        url = reverse('category-list')
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(0))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_lost_version_does_not_revive_old_etags(self):
+        url = reverse('category-list')
+        etag = self.client.get(url)['ETag']
+        cache.delete(CATALOG_VERSION_KEY)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_deploy_check_flags_per_process_cache(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'}}
+        with self.settings(CACHES=locmem):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['rest.W001'])
+        with self.settings(CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+from django.test import RequestFactory, override_settings
+from django.http import HttpResponse
+from django.test import AsyncClient
+from rest_framework_simplejwt.tokens import AccessToken
+from .instrumentation import RequestMetricsMiddleware, registry
+
+
+class RequestMetricsTestCase(APITestCase):
+
+    def setUp(self):
+        registry.reset()
+        self.staff = get_user_model().objects.create_user(username='ops', password='pass', is_staff=True)
+        drinks = Category.objects.create(name="Drinks", description="Cold")
+        Product.objects.create(name="Tea", price=2.50, category=drinks)
+
+    def test_requests_are_keyed_by_viewset_and_action(self):
+        self.client.force_authenticate(user=self.staff)
+        self.client.get(reverse('product-list'))
+        self.client.get(reverse('product-available-products'))
+        self.client.get(reverse('product-available-products'))
+
+        series = registry.snapshot()
+        available = series[('ProductViewSet', 'available_products', 'GET')]
+        self.assertEqual(available['requests'], 2)
+        self.assertGreater(available['queries'], 0)
+        self.assertGreater(available['wall_seconds'], available['db_seconds'])
+        self.assertEqual(sum(available['buckets']), 2)
+        self.assertIn(('ProductViewSet', 'list', 'GET'), series)
+
+    async def test_async_requests_count_their_queries(self):
+        response = await AsyncClient().get(
+            reverse('product-list'), headers={'Authorization': f'Bearer {AccessToken.for_user(self.staff)}'},
         )
-        OrderItem.objects.create(
-            order=order,
-            product=self.product1,
-            quantity=order_data['order_items'][0]['quantity']
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        series = registry.snapshot()[('ProductViewSet', 'list', 'GET')]
+        self.assertGreater(series['queries'], 0)
+        self.assertGreater(series['db_seconds'], 0)
+
+    def test_duplicate_statements_are_flagged(self):
+        def get_response(request):
+            for _ in range(6):
+                list(Product.objects.filter(pk=1))
+            return HttpResponse()
+
+        with self.assertLogs('rest.instrumentation', 'WARNING'):
+            RequestMetricsMiddleware(get_response)(RequestFactory().get('/'))
+        series = registry.snapshot()[('unmatched', '', 'GET')]
+        self.assertEqual(series['n_plus_one'], 1)
+        self.assertEqual(series['queries'], 6)
+
+    def test_metrics_endpoint(self):
+        self.client.force_authenticate(user=self.staff)
+        self.client.get(reverse('category-list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('rest_requests_total{view="CategoryViewSet",action="list",method="GET"} 1', body)
+        self.assertIn('# TYPE rest_request_duration_seconds histogram', body)
+        self.assertIn('le="+Inf"', body)
+
+    @override_settings(REQUEST_METRICS_TOKEN='scrape-me')
+    def test_metrics_endpoint_permissions(self):
+        self.client.force_authenticate(user=get_user_model().objects.create_user(username='pos', password='pass'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=None)
+        response = self.client.get(reverse('metrics'), HTTP_X_METRICS_TOKEN='scrape-me')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+from .benchmarks import seed_orders, seed_products
+
+
+class BenchmarkSeedTestCase(TestCase):
+
+    def test_seeded_orders_are_consistent(self):
+        seed_products(10, categories=2)
+        products = list(Product.objects.values_list('id', 'price'))
+        seed_orders(30, products=products, chunk_size=7)
+        seed_orders(5, products=products)
+
+        self.assertEqual(Order.objects.count(), 35)
+        self.assertEqual(Order.objects.filter(order_items__isnull=True).count(), 0)
+        for order in Order.objects.all():
+            seeded = order.total_amount
+            order.update_total()
+            self.assertEqual(order.total_amount, seeded)
+
+
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+class AsyncReadViewsTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create_user(username='tablet', password='pass')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+        self.drinks = Category.objects.create(name="Drinks", description="Cold")
+        self.mains = Category.objects.create(name="Mains", description="Hot")
+        self.products = [
+            Product.objects.create(name=f"Dish {i}", price=i + 1, category=self.mains if i % 2 else self.drinks)
+            for i in range(7)
+        ]
+        self.order = Order.objects.create(customer="Table 4", status='pending')
+
+    def test_requires_token(self):
+        response = self.client.get(reverse('async-product-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get(reverse('async-product-list'), HTTP_AUTHORIZATION='Bearer nope')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_product_list_filters_and_pages_by_cursor(self):
+        response = self.client.get(reverse('async-product-list'), {'price_gte': 2, 'page_size': 3}, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first = response.json()
+        self.assertEqual([p['name'] for p in first['results']], ["Dish 6", "Dish 5", "Dish 4"])
+
+        second = self.client.get(first['next'], **self.auth).json()
+        self.assertEqual([p['name'] for p in second['results']], ["Dish 3", "Dish 2", "Dish 1"])
+        self.assertIsNone(second['next'])
+
+        response = self.client.get(reverse('async-product-list'), {'category': self.drinks.pk}, **self.auth)
+        self.assertEqual({p['category_name'] for p in response.json()['results']}, {"Drinks"})
+        response = self.client.get(reverse('async-product-list'), {'price_gte': 'x'}, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_matches_sync_endpoints(self):
+        product = self.products[0]
+        sync = self.client.get(reverse('product-check-availability', args=[product.pk]), **self.auth).json()
+        response = self.client.get(reverse('async-product-check-availability', args=[product.pk]), **self.auth)
+        self.assertEqual(response.json(), sync)
+
+        sync = self.client.get(reverse('product-menu-by-category'), **self.auth).json()
+        self.assertEqual(self.client.get(reverse('async-menu-by-category'), **self.auth).json(), sync)
+
+        response = self.client.get(reverse('async-order-status', args=[self.order.pk]), **self.auth).json()
+        self.assertEqual(response['status'], 'pending')
+        self.assertEqual(response['total_amount'], '0.00')
+        missing = self.client.get(reverse('async-order-status', args=[0]), **self.auth)
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_menu_conditional_get(self):
+        url = reverse('async-menu-by-category')
+        etag = self.client.get(url, **self.auth)['ETag']
+        # The user was cached by the first request
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.products[0].delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sum(len(c['products']) for c in response.json()), 6)
+
+
+import asyncio
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient
+from .events import InMemoryBroker, get_broker, reset_broker
+
+
+class OrderEventsTestCase(TestCase):
+
+    def setUp(self):
+        reset_broker()
+        self.user = get_user_model().objects.create_user(username='screen', password='pass')
+        self.drinks = Category.objects.create(name="Drinks", description="Cold")
+        self.tea = Product.objects.create(name="Tea", price=2.50, category=self.drinks)
+
+    def test_in_memory_broker_fans_out_and_replays(self):
+        broker = InMemoryBroker(history=2)
+
+        async def consume():
+            first, second = broker.subscribe(), broker.subscribe()
+            await asyncio.get_running_loop().run_in_executor(None, broker.publish, {'type': 'created'})
+            events = [await anext(first), await anext(second)]
+            second.close()
+            broker.publish({'type': 'status_changed'})
+            broker.publish({'type': 'total_changed'})
+            events.append(await anext(first))
+            replay = broker.subscribe(last_event_id=2)
+            events.append(await anext(replay))
+            first.close()
+            replay.close()
+            return events
+
+        events = asyncio.run(consume())
+        self.assertEqual([e['id'] for e in events], [1, 1, 2, 3])
+        self.assertFalse(broker.has_subscribers())
+
+    def test_order_changes_are_published_after_commit(self):
+        broker = get_broker()
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(customer="Table 1", status='pending')
+            item = OrderItem.objects.create(order_id=order.pk, product=self.tea, quantity=2)
+            self.assertEqual(len(broker._history), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'completed'
+            order.save()
+        events = list(broker._history)
+        self.assertEqual([e['type'] for e in events], ['created', 'total_changed', 'status_changed'])
+        self.assertEqual(events[1]['delta'], '5.00')
+        self.assertEqual(events[2]['old_status'], 'pending')
+        self.assertEqual(events[2]['order']['status'], 'completed')
+
+    async def test_sse_stream_filters_by_status(self):
+        response = await AsyncClient().get(
+            reverse('order-events'), {'status': 'completed'},
+            headers={'Authorization': f'Bearer {AccessToken.for_user(self.user)}'},
         )
-        
-        self.assertTrue(Product.objects.get(id=self.product1.id).is_available)
-        
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+
+        def write():
+            with self.captureOnCommitCallbacks(execute=True):
+                order = Order.objects.create(customer="Table 2", status='pending')
+            with self.captureOnCommitCallbacks(execute=True):
+                order.status = 'completed'
+                order.save()
+            return order
+
+        order = await sync_to_async(write)()
+        chunk = (await anext(stream)).decode()
+        self.assertIn('event: status_changed', chunk)
+        self.assertIn(f'"id": {order.pk}', chunk)
+        response.close()
+        self.assertFalse(get_broker().has_subscribers())
+
+
+class BatchAvailabilityTestCase(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(user=get_user_model().objects.create_user(username='cart', password='pass'))
+        drinks = Category.objects.create(name="Drinks", description="Cold")
+        self.tea = Product.objects.create(name="Tea", price=2.50, category=drinks, preparation_time=3)
+        self.juice = Product.objects.create(name="Juice", price=4, category=drinks, stock=0)
+        self.url = reverse('product-batch-availability')
+
+    def test_one_query_in_request_order(self):
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                self.url, {'ids': [self.juice.pk, self.tea.pk, 999, self.tea.pk]}, format='json',
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [
+            {'product_id': self.juice.pk, 'product_name': "Juice", 'is_available': False,
+             'price': '4.00', 'preparation_time': 15},
+            {'product_id': self.tea.pk, 'product_name': "Tea", 'is_available': True,
+             'price': '2.50', 'preparation_time': 3},
+        ])
+        self.assertEqual(response.data['missing'], [999])
+
+    def test_validation(self):
+        self.assertEqual(self.client.post(self.url, {'ids': []}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(self.url, {'ids': ['x']}, format='json').status_code, 400)
+        too_many = {'ids': list(range(1, 502))}
+        self.assertEqual(self.client.post(self.url, too_many, format='json').status_code, 400)
+
+
+from importlib import import_module
+
+from django.apps import apps
+from django.db import connection
+
+from .models import Customer
+from .serializers import RECENT_ORDERS
+
+
+class CustomerOrdersTestCase(APITestCase):
+
+    def setUp(self):
+        User = get_user_model()
+        self.client.force_authenticate(user=User.objects.create_user(username='desk', password='pass'))
+        self.alice = Customer.objects.create(user=User.objects.create_user(username='alice'), phone="1")
+        self.bob = Customer.objects.create(user=User.objects.create_user(username='bob'), phone="2")
+
+    def test_new_orders_are_not_linked_by_name(self):
+        # A walk-in's free-text name matching a username must not hand them the account
+        walk_in = Order.objects.create(customer='alice', status='pending')
+        order = Order.objects.create(customer="Alice S.", customer_account=self.alice, status='pending')
+        self.assertIsNone(Order.objects.get(pk=walk_in.pk).customer_account)
+        self.assertEqual(Order.objects.get(pk=order.pk).customer_account, self.alice)
+
+    def test_migration_links_existing_orders(self):
+        orders = [Order.objects.create(customer=name, status='pending') for name in ('alice', 'bob', 'carol')]
+        migration = import_module('rest.migrations.0003_link_order_customer_accounts')
+        migration.link_orders(apps, connection.schema_editor())
+        self.assertEqual(
+            [Order.objects.get(pk=order.pk).customer_account_id for order in orders],
+            [self.alice.pk, self.bob.pk, None],
+        )
+
+    def test_batch_accepts_and_checks_accounts(self):
+        product = Product.objects.create(name="Tea", price=2, category=Category.objects.create(name="Drinks"))
+        response = self.client.post(reverse('order-batch-create'), [
+            {'customer': "Front desk", 'customer_account': self.bob.pk, 'status': 'pending',
+             'items': [{'product': product.pk}]},
+            {'customer': 'alice', 'status': 'pending', 'items': [{'product': product.pk}]},
+            {'customer': "Ghost", 'customer_account': 999, 'status': 'pending',
+             'items': [{'product': product.pk}]},
+        ], format='json')
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'created', 'invalid'])
+        self.assertEqual(Order.objects.get(pk=results[0]['id']).customer_account, self.bob)
+        self.assertIsNone(Order.objects.get(pk=results[1]['id']).customer_account)
+
+    def test_list_queries_do_not_grow_with_orders(self):
+        for i in range(RECENT_ORDERS + 3):
+            Order.objects.create(customer='alice', customer_account=self.alice, status='pending')
+        Order.objects.create(customer='bob', customer_account=self.bob, status='completed')
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('customer-list'))
+        rows = {row['id']: row for row in response.data['results']}
+        self.assertEqual(rows[self.alice.pk]['order_count'], RECENT_ORDERS + 3)
+        self.assertEqual(len(rows[self.alice.pk]['orders']), RECENT_ORDERS)
+        self.assertEqual(rows[self.bob.pk]['order_count'], 1)
+
+    def test_orders_action_is_paginated(self):
+        orders = [
+            Order.objects.create(customer='alice', customer_account=self.alice, status='pending')
+            for _ in range(3)
+        ]
+        Order.objects.create(customer='bob', customer_account=self.bob, status='pending')
+        response = self.client.get(reverse('customer-orders', args=[self.alice.pk]), {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in response.data['results']], [orders[2].pk, orders[1].pk])
+        self.assertIsNotNone(response.data['next'])
+
+
+from django.conf import settings
+from django.test import override_settings
+
+from .db_routers import PIN_COOKIE, PIN_HEADER
+from .runner import TEST_REPLICAS as REPLICAS
+
+
+@override_settings(DATABASE_READ_REPLICAS=list(REPLICAS))
+class ReplicaRoutingTestCase(APITestCase):
+
+    databases = {'default', *REPLICAS}
+
+    def setUp(self):
+        self.client.force_authenticate(user=get_user_model().objects.create_user(username='reader'))
+        self.category = Category.objects.create(name="Drinks")
+        self.tea = Product.objects.create(name="Tea", price=2, category=self.category)
+
+    def replicate(self):
+        """Copy the catalog and orders from the primary, like replication would."""
+        for alias in REPLICAS:
+            for model in (Order, Product, Category):
+                model.objects.using(alias).all()._raw_delete(alias)
+            for model in (Category, Product, Order):
+                model.objects.using(alias).bulk_create(model.objects.using('default').all())
+
+    def test_reads_use_a_replica_and_writes_the_primary(self):
+        self.replicate()
+        Product.objects.filter(pk=self.tea.pk).update(name="Green tea")
+        response = self.client.get(reverse('product-detail', args=[self.tea.pk]))
+        self.assertEqual(response.data['name'], "Tea")
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        response = self.client.post(reverse('order-list'), {'customer': 'reader', 'status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertFalse(Order.objects.using('replica_a').exists())
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_client_that_wrote_reads_its_writes(self):
+        self.replicate()
+        self.client.post(reverse('order-list'), {'customer': 'reader', 'status': 'pending'}, format='json')
+        response = self.client.get(reverse('order-list'))
+        self.assertEqual(len(response.data['results']), 1)
+
+        del self.client.cookies[PIN_COOKIE]
+        response = self.client.get(reverse('order-list'))
+        self.assertEqual(len(response.data['results']), 0)
+
+    def test_client_without_cookies_is_pinned_by_header(self):
+        self.replicate()
+        response = self.client.post(reverse('order-list'), {'customer': 'reader', 'status': 'pending'}, format='json')
+        pin = response[PIN_HEADER]
+        self.client.cookies.clear()
+
+        response = self.client.get(reverse('order-list'), HTTP_DB_PIN=pin)
+        self.assertEqual(len(response.data['results']), 1)
+        response = self.client.get(reverse('order-list'), HTTP_DB_PIN=str(int(pin) - 3600))
+        self.assertEqual(len(response.data['results']), 0)
+        response = self.client.get(reverse('order-list'), HTTP_DB_PIN='soon')
+        self.assertEqual(len(response.data['results']), 0)
+
+    def test_outside_requests_everything_uses_the_primary(self):
+        self.assertEqual(Product.objects.all().db, 'default')
+
+
+from django.core.management import call_command
+
+from .search import LikeBackend, get_search_backend
+
+
+class ProductSearchTestCase(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(user=get_user_model().objects.create_user(username='guest'))
+        self.drinks = Category.objects.create(name="Drinks")
+        self.desserts = Category.objects.create(name="Desserts")
+        self.lemonade = Product.objects.create(name="Lemonade", description="Fresh lemons", price=3, category=self.drinks)
+        self.tart = Product.objects.create(name="Lemon tart", description="Butter pastry", price=6, category=self.desserts)
+        self.cake = Product.objects.create(
+            name="Cheesecake", description="With a lemon glaze", price=7, category=self.desserts, stock=0,
+        )
+        self.url = reverse('product-search')
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row['name'] for row in response.data['results']]
+
+    def test_prefix_matching_and_ranking(self):
+        names = self.search(q="lem")
+        # Name hits rank above the description-only hit
+        self.assertEqual(set(names[:2]), {"Lemonade", "Lemon tart"})
+        self.assertEqual(names[2], "Cheesecake")
+        self.assertEqual(self.search(q="lemon pastr"), ["Lemon tart"])
+
+    def test_combines_with_product_filters(self):
+        self.assertEqual(self.search(q="lemon", category=self.desserts.pk, is_available=True), ["Lemon tart"])
+        self.assertEqual(self.search(q="lemon", price_gte=5), ["Lemon tart", "Cheesecake"])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.tart.name = "Apple tart"
+        self.tart.save()
+        self.assertEqual(self.search(q="apple"), ["Apple tart"])
+        self.lemonade.delete()
+        self.assertEqual(self.search(q="lemon"), ["Cheesecake"])
+
+    def test_rebuild_indexes_bulk_writes(self):
+        Product.objects.bulk_create([Product(name="Lemon sorbet", price=4, category=self.desserts)])
+        self.assertNotIn("Lemon sorbet", self.search(q="sorbet"))
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search(q="sorbet"), ["Lemon sorbet"])
+
+    def test_operators_in_queries_are_literal(self):
+        self.assertEqual(self.search(q='lemon" OR "cake'), [])
+        self.assertEqual(self.client.get(self.url, {'q': ' '}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_like_backend_matches_the_same_products(self):
+        backend = LikeBackend()
+        self.assertEqual(
+            {product.name for product in backend.search(Product.objects.all(), "lemon")},
+            {product.name for product in get_search_backend().search(Product.objects.all(), "lemon")},
+        )
+
+
+from contextlib import contextmanager
+from unittest import mock
+
+from django.db import OperationalError
+from django.test import SimpleTestCase
+
+from .retry import retry_on_lock
+
+
+class SQLiteTuningTestCase(TestCase):
+
+    def test_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+@override_settings(DATABASE_LOCK_RETRIES=2, DATABASE_LOCK_RETRY_DELAY=0)
+class RetryOnLockTestCase(SimpleTestCase):
+
+    def flaky(self, failures, message='database is locked'):
+        """A write whose first ``failures`` transactions fail at BEGIN."""
+        begins, calls = [], []
+
+        @contextmanager
+        def atomic():
+            begins.append(1)
+            if len(begins) <= failures:
+                raise OperationalError(message)
+            yield
+
+        patcher = mock.patch.object(transaction, 'atomic', atomic)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        @retry_on_lock
+        def write():
+            calls.append(1)
+            return len(begins)
+        return write, calls
+
+    def test_retries_lock_contention(self):
+        write, calls = self.flaky(2)
+        with self.assertLogs('rest.retry', 'WARNING') as logs:
+            self.assertEqual(write(), 3)
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual(len(calls), 1)
+
+    def test_gives_up_after_the_configured_retries(self):
+        write, calls = self.flaky(3)
+        with self.assertRaises(OperationalError), self.assertLogs('rest.retry', 'WARNING'):
+            write()
+        self.assertEqual(calls, [])
+
+    def test_other_errors_are_not_retried(self):
+        write, calls = self.flaky(1, message='no such table: rest_order')
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(calls, [])
+
+    def test_errors_after_begin_are_not_retried(self):
+        self.flaky(0)
+
+        @retry_on_lock
+        def write():
+            calls.append(1)
+            raise OperationalError('database is locked')
+        calls = []
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+
+    def test_inner_transactions_are_left_to_the_outer_one(self):
+        write, calls = self.flaky(1)
+        with mock.patch.object(connection, 'in_atomic_block', True):
+            self.assertEqual(write(), 0)
+        self.assertEqual(len(calls), 1)
+
+
+from .authentication import UserCache, user_cache
+
+
+class CachedJWTAuthenticationTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.user = get_user_model().objects.create_user(username='waiter', password='pass')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.menu_url = reverse('product-menu-by-category')
+
+    def test_user_is_looked_up_once(self):
+        etag = self.client.get(self.menu_url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.menu_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_role_and_active_changes_apply_at_once(self):
+        url = reverse('category-list')
+        soups = {'name': "Soups", 'description': "Hot"}
+        self.assertEqual(self.client.post(url, soups).status_code, status.HTTP_403_FORBIDDEN)
+        self.user.role = 'manager'
+        self.user.save()
+        self.assertEqual(self.client.post(url, soups).status_code, status.HTTP_201_CREATED)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.menu_url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(JWT_TRUST_ROLE_CLAIMS=True)
+    def test_trusted_role_claims_skip_the_lookup(self):
+        self.user.role = 'manager'
+        self.user.save()
+        tokens = self.client.post(reverse('token_obtain_pair'), {'username': 'waiter', 'password': 'pass'}).data
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        url = reverse('category-list')
+        with self.assertNumQueries(1):  # just the insert
+            response = self.client.post(url, {'name': "Soups", 'description': "Hot"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # A refreshed token carries the current role
+        self.user.role = 'staff'
+        self.user.save()
+        access = self.client.post(reverse('token_refresh'), {'refresh': tokens['refresh']}).data['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = self.client.post(url, {'name': "Salads", 'description': "Cold"})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class UserCacheTestCase(SimpleTestCase):
+
+    @override_settings(AUTH_USER_CACHE_SIZE=2)
+    def test_least_recently_used_entry_is_dropped(self):
+        users = UserCache()
+        users.set(1, 'one')
+        users.set(2, 'two')
+        users.get(1)
+        users.set(3, 'three')
+        self.assertEqual([users.get(1), users.get(2), users.get(3)], ['one', None, 'three'])
+
+    @override_settings(AUTH_USER_CACHE_SECONDS=60)
+    def test_entries_expire(self):
+        users = UserCache()
+        with mock.patch('rest.authentication.time.monotonic', return_value=1000):
+            users.set(1, 'one')
+        with mock.patch('rest.authentication.time.monotonic', return_value=1059):
+            self.assertEqual(users.get(1), 'one')
+        with mock.patch('rest.authentication.time.monotonic', return_value=1061):
+            self.assertIsNone(users.get(1))
+
+
+import time
+from datetime import timedelta
+from django.core import mail
+from .jobs import JobRunner, claim_job, enqueue, render_metrics, run_job, task
+from .models import Job
+
+flaky_calls = []
+
+
+@task('tests.flaky', max_attempts=2)
+def flaky(fail_times=0, category=None):
+    flaky_calls.append(category)
+    if category:
+        Category.objects.create(name=category)
+    if len(flaky_calls) <= fail_times:
+        raise ValueError("flaky")
+
+
+class BackgroundJobTestCase(APITestCase):
+
+    def setUp(self):
+        flaky_calls.clear()
+
+    def test_jobs_are_enqueued_with_the_transaction(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            enqueue('tests.flaky')
+            raise RuntimeError
+        self.assertFalse(Job.objects.exists())
+        self.assertIsNotNone(enqueue('tests.flaky', key='once'))
+        self.assertIsNone(enqueue('tests.flaky', key='once'))
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(flaky_calls, [None])
+
+    def test_failures_back_off_then_fail(self):
+        job = enqueue('tests.flaky', {'fail_times': 5})
+        with self.assertLogs('rest.jobs', 'ERROR'):
+            self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn("ValueError", job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(run_pending(), 0)
+
+        Job.objects.update(run_after=timezone.now())
+        with self.assertLogs('rest.jobs', 'ERROR'):
+            run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+    def test_expired_lease_is_claimed_again_and_stale_worker_rolls_back(self):
+        enqueue('tests.flaky', {'category': "Soups"})
+        stale = claim_job()
+        self.assertIsNone(claim_job())
+        Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        fresh = claim_job()
+        self.assertEqual((fresh.pk, fresh.attempts), (stale.pk, 2))
+
+        with self.assertLogs('rest.jobs', 'WARNING'):
+            self.assertEqual(run_job(stale), 'lost')
+        self.assertFalse(Category.objects.filter(name="Soups").exists())
+        self.assertEqual(run_job(fresh), 'done')
+        self.assertTrue(Category.objects.filter(name="Soups").exists())
+
+    def test_completed_orders_get_one_receipt(self):
+        user = get_user_model().objects.create_user(username='alice', email='alice@example.com')
+        account = Customer.objects.create(user=user, phone="1")
+        category = Category.objects.create(name="Mains", description="Main dishes")
+        product = Product.objects.create(name="Burger", price=Decimal('9.50'), category=category)
+        order = Order.objects.create(customer='alice', customer_account=account, status='pending')
+        OrderItem.objects.create(order=order, product=product, quantity=2)
+        for status_value in ('completed', 'pending', 'completed'):
+            order.status = status_value
+            order.save()
+        self.assertEqual(mail.outbox, [])
+
+        run_pending()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['alice@example.com'])
+        self.assertIn("2 x Burger  19.00", mail.outbox[0].body)
+        self.assertFalse(Job.objects.exclude(status='done').exists())
+
+    def test_receipt_lines_use_stored_prices(self):
+        user = get_user_model().objects.create_user(username='bob', email='bob@example.com')
+        account = Customer.objects.create(user=user, phone="2")
+        category = Category.objects.create(name="Mains", description="Main dishes")
+        product = Product.objects.create(name="Burger", price=Decimal('9.50'), category=category)
+        order = Order.objects.create(customer='bob', customer_account=account, status='pending')
+        OrderItem.objects.create(order=order, product=product, quantity=2)
         order.status = 'completed'
         order.save()
-        
-        self.assertFalse(Product.objects.get(id=self.product1.id).is_available)
-        
-        order.status = 'canceled'
+        Product.objects.filter(pk=product.pk).update(price=Decimal('12.00'))
+        run_pending()
+        self.assertIn("2 x Burger  19.00", mail.outbox[0].body)
+        self.assertIn("Total: 19.00", mail.outbox[0].body)
+
+    def test_backfill_voids_running_rollup_jobs(self):
+        category = Category.objects.create(name="Mains", description="Main dishes")
+        product = Product.objects.create(name="Burger", price=Decimal('9.50'), category=category)
+        order = Order.objects.create(customer="Table 1", status='pending')
+        OrderItem.objects.create(order=order, product=product, quantity=2)
+        run_pending()
+        order.status = 'completed'
         order.save()
-        
-        self.assertTrue(Product.objects.get(id=self.product1.id).is_available)
-   
\ No newline at end of file
+        running = claim_job()
+        call_command('backfill_rollups', stdout=StringIO())
+        with self.assertLogs('rest.jobs', 'WARNING'):
+            self.assertEqual(run_job(running), 'lost')
+        burger = ProductSalesRollup.objects.get(period='day', product=product)
+        self.assertEqual((burger.revenue, burger.units, burger.order_count), (Decimal('19.00'), 2, 1))
+
+    def test_queue_metrics(self):
+        enqueue('tests.flaky')
+        Job.objects.update(run_after=timezone.now() - timedelta(seconds=30))
+        enqueue('tests.flaky', delay=60)
+        body = render_metrics()
+        self.assertIn('rest_jobs{status="queued"} 2', body)
+        lag = float(body.split('\nrest_jobs_lag_seconds ')[1].split()[0])
+        self.assertGreaterEqual(lag, 30)
+
+        self.client.force_authenticate(user=get_user_model().objects.create_user(username='ops', is_staff=True))
+        run_pending()
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('rest_jobs{status="done"} 1', body)
+        self.assertIn('rest_jobs_processed_total{task="tests.flaky",outcome="done"}', body)
+
+
+class JobRunnerTestCase(TransactionTestCase):
+
+    def test_worker_threads_drain_the_queue(self):
+        for number in range(6):
+            enqueue('tests.flaky', {'category': f"Category {number}"})
+        runner = JobRunner(workers=2, poll_seconds=0.05)
+        runner.start()
+        try:
+            deadline = time.monotonic() + 10
+            while Job.objects.exclude(status='done').exists() and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            runner.stop(timeout=5)
+        self.assertEqual(Job.objects.filter(status='done').count(), 6)
+        self.assertEqual(Category.objects.count(), 6)
+
+
+from django.test import override_settings
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from .models import IdempotencyKey
+from .views import OrderViewset
+
+
+class IdempotentOrderCreateTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='till', password='pass')
+        self.client.force_authenticate(user=self.user)
+        self.tea = Product.objects.create(
+            name="Tea", price=Decimal('2.50'), category=Category.objects.create(name="Drinks"),
+        )
+
+    def _post(self, data, key='retry-1', url=None):
+        return self.client.post(url or reverse('order-list'), data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retries_replay_the_first_response(self):
+        first = self._post({'customer': "Table 2", 'status': 'pending'})
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        with self.assertNumQueries(1):
+            retry = self._post({'customer': "Table 2", 'status': 'pending'})
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Location'], first['Location'])
+        self.assertTrue(first['Location'].endswith(reverse('order-detail', args=[first.data['id']])))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+        self._post({'customer': "Table 2", 'status': 'pending'}, key='retry-2')
+        self.client.post(reverse('order-list'), {'customer': "Table 2", 'status': 'pending'}, format='json')
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_key_reused_for_another_request_is_refused(self):
+        self._post({'customer': "Table 2", 'status': 'pending'})
+        response = self._post({'customer': "Table 3", 'status': 'pending'})
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_keys_are_scoped_per_user(self):
+        self._post({'customer': "Table 2", 'status': 'pending'})
+        self.client.force_authenticate(user=get_user_model().objects.create_user(username='bar'))
+        self.assertNotIn('Idempotent-Replayed', self._post({'customer': "Table 2", 'status': 'pending'}))
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_errors_are_not_stored(self):
+        response = self._post({'customer': "Table 2", 'status': 'lost'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self._post({'customer': "Table 2", 'status': 'lost'}).status_code, 400)
+
+    def test_expired_keys_run_again(self):
+        self._post({'customer': "Table 2", 'status': 'pending'})
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        response = self._post({'customer': "Table 2", 'status': 'pending'})
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Order.objects.count(), 2)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        enqueue('idempotency.prune')
+        run_pending()
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_batch_create_is_idempotent(self):
+        url = reverse('order-batch-create')
+        payload = [{'customer': "Bar", 'status': 'pending', 'items': [{'product': self.tea.pk, 'quantity': 2}]}]
+        first = self._post(payload, url=url)
+        retry = self._post(payload, url=url)
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+    def test_lock_errors_inside_the_view_are_not_retried(self):
+        with mock.patch.object(
+            OrderViewset, 'perform_create', side_effect=OperationalError('database is locked'),
+        ) as perform_create, self.assertRaises(OperationalError):
+            self._post({'customer': "Table 2", 'status': 'pending'})
+        self.assertEqual(perform_create.call_count, 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_server_errors_roll_back_the_view(self):
+        def half_done(viewset, request, *args, **kwargs):
+            Order.objects.create(customer="Table 2", status='pending')
+            return Response({'detail': "Printer offline."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        with mock.patch('rest_framework.mixins.CreateModelMixin.create', half_done):
+            response = self._post({'customer': "Table 2", 'status': 'pending'})
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.assertEqual(self._post({'customer': "Table 2", 'status': 'pending'}).status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_invalid_key(self):
+        response = self._post({'customer': "Table 2", 'status': 'pending'}, key='x' * 256)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+    def test_anonymous_keys_are_refused(self):
+        self.client.force_authenticate(user=None)
+        response = self._post({'customer': "Table 2", 'status': 'pending'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class IdempotentConcurrencyTestCase(TransactionTestCase):
+
+    def test_concurrent_duplicates_create_one_order(self):
+        user = get_user_model().objects.create_user(username='till', password='pass')
+        responses = []
+
+        def submit():
+            client = APIClient()
+            client.force_authenticate(user=user)
+            try:
+                while True:
+                    try:
+                        responses.append(client.post(
+                            reverse('order-list'), {'customer': "Table 9", 'status': 'pending'},
+                            format='json', HTTP_IDEMPOTENCY_KEY='double-tap',
+                        ))
+                    except OperationalError:
+                        continue  # SQLite lock contention, send the request again
+                    break
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=submit) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual({response.status_code for response in responses}, {status.HTTP_201_CREATED})
+        self.assertEqual(len({response.data['id'] for response in responses}), 1)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+
+from django.contrib.admin.sites import site as admin_site
+
+
+class ProductAdminTestCase(TestCase):
+
+    def test_availability_is_read_only_for_tracked_stock(self):
+        category = Category.objects.create(name="Mains", description="Main dishes")
+        tracked = Product.objects.create(name="Pie", price=5, category=category, stock=3)
+        untracked = Product.objects.create(name="Soup", price=4, category=category)
+        model_admin = admin_site._registry[Product]
+        self.assertNotIn('is_available', model_admin.list_editable)
+        self.assertEqual(model_admin.get_readonly_fields(None, tracked), ('is_available',))
+        self.assertEqual(model_admin.get_readonly_fields(None, untracked), ())
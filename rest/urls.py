@@ -2,7 +2,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import CategoryViewSet, ProductViewSet,CustomerViewSet
 
-from .views import OrderViewset
+from .views import MetricsView, OrderViewset, SalesAnalyticsViewSet
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'categories', CategoryViewSet, basename='category')
@@ -10,10 +11,19 @@ router.register(r'products', ProductViewSet, basename='product')
 router.register(r'customers', CustomerViewSet, basename='customer')
 
 router.register('Orders/', OrderViewset)
+router.register(r'analytics', SalesAnalyticsViewSet, basename='analytics')
 
 urlpatterns = [
     path('', include(router.urls)),
 ]
 
 urlpatterns = router.urls
-
+urlpatterns += [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path('async/products/menu-by-category/', async_views.menu_by_category, name='async-menu-by-category'),
+    path('async/products/<int:pk>/check-availability/', async_views.check_availability,
+         name='async-product-check-availability'),
+    path('async/orders/<int:pk>/status/', async_views.order_status, name='async-order-status'),
+    path('async/orders/events/', async_views.order_events, name='order-events'),
+]
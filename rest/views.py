@@ -1,13 +1,37 @@
+from datetime import datetime, time, timedelta
+
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from .serializers import CategorySerializer,OrderSerializer, ProductSerializer
+from .serializers import AvailabilityCheckSerializer
 from .models import Category,Order, Product
 from rest_framework import viewsets,status
 from rest_framework.permissions import IsAuthenticated
-from .permissions import IsAdminOrReadOnly
+from .permissions import CanScrapeMetrics, IsAdminOrReadOnly
+from .menu import menu_engine
+from .batch import MAX_BATCH_SIZE, create_order_batch
+from .pagination import KeysetPagination
+from .export import EXPORT_FORMATS, iter_orders
+from .kitchen import get_scheduler
+from .conditional import catalog_conditional
+from .search import get_search_backend
+from .instrumentation import registry
+from .jobs import render_metrics as render_job_metrics
+from .idempotency import idempotent
+from .renderers import PrometheusTextRenderer
+from .fast_serializers import (
+    fast_availability_serializer,
+    fast_category_serializer,
+    fast_order_serializer,
+    fast_product_serializer,
+)
 
 
 from rest_framework.permissions import SAFE_METHODS, BasePermission
 from rest_framework.decorators import action
+from rest_framework.reverse import reverse
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.pagination import PageNumberPagination
@@ -25,6 +49,21 @@ class ProductFilter(filters.FilterSet):
 
 
 
+class FastListMixin:
+    """Serve list responses from .values() rows via a ValuesSerializer."""
+    fast_serializer = None
+
+    def list(self, request, *args, **kwargs):
+        return self.fast_list_response(self.filter_queryset(self.get_queryset()))
+
+    def fast_list_response(self, queryset):
+        rows = self.fast_serializer.values(queryset)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.fast_serializer.many(page))
+        return Response(self.fast_serializer.many(rows))
+
+
 class IsAdminOrManager(BasePermission):
     def has_permission(self, request, view):
         if request.method in SAFE_METHODS:  
@@ -33,9 +72,10 @@ class IsAdminOrManager(BasePermission):
             request.user.is_staff or getattr(request.user, 'role', '') == 'manager'
         )
     
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(FastListMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    fast_serializer = fast_category_serializer
     permission_classes = [IsAuthenticated]
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -43,19 +83,125 @@ class CategoryViewSet(viewsets.ModelViewSet):
 
         return [IsAuthenticated()]  
 
+    @catalog_conditional
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+
 
 
 
+def parse_moment(value, end=False):
+    """Parse an ISO date or datetime query parameter into an aware datetime.
 
-class OrderPagination(PageNumberPagination):
+    With ``end``, for the exclusive upper bound of a range, a bare date
+    means the end of that day, so ``date_to=2024-05-31`` includes the 31st.
+    """
+    try:
+        day = parse_date(value)
+        if day is None:
+            moment = parse_datetime(value)
+        else:
+            moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    except ValueError:
+        return None
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class OrderPagination(KeysetPagination):
     page_size = 5
+    keyset_fields = ('order_date', 'id')
+
+
+class ProductPagination(KeysetPagination):
+    keyset_fields = ('created_at', 'id')
 
-class OrderViewset(viewsets.ModelViewSet):
+
+class SearchPagination(PageNumberPagination):
+    # Results are ranked, so pages are numbered rather than keyset
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+class OrderViewset(FastListMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    fast_serializer = fast_order_serializer
     pagination_class = OrderPagination
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['status', 'customer']
+    filterset_fields = ['status', 'customer', 'customer_account']
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    def get_success_headers(self, data):
+        return {'Location': reverse('order-detail', args=[data['id']], request=self.request)}
+
+    @action(detail=False, methods=['POST'], url_path='batch')
+    @idempotent
+    def batch_create(self, request):
+        entries = request.data
+        if not isinstance(entries, list) or not entries:
+            return Response(
+                {'detail': 'Expected a non-empty list of orders.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(entries) > MAX_BATCH_SIZE:
+            return Response(
+                {'detail': f'At most {MAX_BATCH_SIZE} orders per batch.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = create_order_batch(entries)
+        created = sum(1 for result in results if result['status'] == 'created')
+        if created == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'created': created, 'results': results}, status=response_status)
+
+    @action(detail=True, methods=['GET'], url_path='eta')
+    def eta(self, request, pk=None):
+        order = self.get_object()
+        scheduler = get_scheduler()
+        return Response({
+            'order_id': order.id,
+            'status': order.status,
+            'estimated_ready_at': scheduler.estimated_ready_at(order.id),
+            'tasks': scheduler.plan_for(order.id),
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['GET'], url_path='export')
+    def export(self, request):
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'detail': f"export_format must be one of {', '.join(EXPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        queryset = self.filter_queryset(self.get_queryset())
+        for param, lookup in (('date_from', 'order_date__gte'), ('date_to', 'order_date__lt')):
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            moment = parse_moment(value, end=param == 'date_to')
+            if moment is None:
+                return Response(
+                    {'detail': f'{param} must be an ISO date or datetime.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            queryset = queryset.filter(**{lookup: moment})
+
+        render_rows, content_type = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(render_rows(iter_orders(queryset)), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+        return response
 
 
 
@@ -63,7 +209,8 @@ class OrderViewset(viewsets.ModelViewSet):
 
 from rest_framework import viewsets
 from .models import Customer
-from .serializers import CustomerSerializer
+from .serializers import RECENT_ORDERS, CustomerSerializer
+from django.db.models import Count, Prefetch
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 
@@ -72,30 +219,44 @@ class CustomerViewSet(viewsets.ModelViewSet):
     serializer_class = CustomerSerializer
     permission_classes = [IsAuthenticated]
 
-
-
+    def get_queryset(self):
+        queryset = Customer.objects.order_by('id')
+        if self.action == 'orders':
+            return queryset
+        # Count plus the newest few orders for every customer on the page in
+        # two queries, however many orders each customer has
+        recent = Order.objects.order_by('-order_date', '-id')[:RECENT_ORDERS]
+        return queryset.annotate(order_count=Count('orders')).prefetch_related(
+            Prefetch('orders', queryset=recent, to_attr='recent_orders'),
+        )
 
     @action(detail=True, methods=['get'])
     def orders(self, request, pk=None):
         customer = self.get_object()
-        orders = customer.order_set.all()  
-        data = OrderSerializer(orders, many=True).data
-        return Response(data)
+        paginator = OrderPagination()
+        rows = fast_order_serializer.values(customer.orders.order_by('-order_date', '-id'))
+        page = paginator.paginate_queryset(rows, request, view=self)
+        return paginator.get_paginated_response(fast_order_serializer.many(page))
     
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(FastListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    fast_serializer = fast_product_serializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_class = ProductFilter
-    pagination_class = PageNumberPagination
+    pagination_class = ProductPagination
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
            return [IsAdminOrManager()]
 
         return [IsAuthenticated()]  
+
+    @catalog_conditional
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
     @action(detail=True, methods=['GET'], url_path='check-availability')
     def check_availability(self, request, pk=None):
@@ -108,37 +269,163 @@ class ProductViewSet(viewsets.ModelViewSet):
             'message': 'Available for order' if product.is_available else 'Currently unavailable'
         }, status=status.HTTP_200_OK)
     
+    @action(detail=False, methods=['POST'], url_path='check-availability')
+    def batch_availability(self, request):
+        """Availability, price and prep time for a cart's products in one query.
+
+        Results keep the order of ``ids`` (duplicates dropped); unknown ids
+        are listed under ``missing`` instead of failing the whole check.
+        """
+        serializer = AvailabilityCheckSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+
+        rows = fast_availability_serializer.values(Product.objects.filter(pk__in=ids))
+        found = {row['id']: row for row in rows}
+        return Response({
+            'results': fast_availability_serializer.many(found[pk] for pk in ids if pk in found),
+            'missing': [pk for pk in ids if pk not in found],
+        }, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['GET'], url_path='available')
+    @catalog_conditional
     def available_products(self, request):
         queryset = self.filter_queryset(self.get_queryset())
         
         available_products = queryset.filter(is_available=True)
         
-        page = self.paginate_queryset(available_products)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = self.get_serializer(available_products, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.fast_list_response(available_products)
     
+    @action(detail=False, methods=['GET'], url_path='search', pagination_class=SearchPagination)
+    @catalog_conditional
+    def search(self, request):
+        """Products matching every word of ``q``, best match first.
+
+        Words match as prefixes, for type-ahead; the ProductFilter
+        category, price and availability filters apply as on the list.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'detail': 'q is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = get_search_backend().search(self.filter_queryset(self.get_queryset()), query)
+        return self.fast_list_response(queryset)
+
     @action(detail=False, methods=['GET'], url_path='menu-by-category')
+    @catalog_conditional
     def menu_by_category(self, request):
-        
-        categories = Category.objects.filter(is_active=True).prefetch_related('products')
-        
-        result = []
-        for category in categories:
-            products = category.products.filter(is_available=True)
-            if products.exists():  # Only include categories with available products
-                serializer = ProductSerializer(products, many=True)
-                result.append({
-                    'category_id': category.id,
-                    'category_name': category.name,
-                    'category_description': category.description,
-                    'products': serializer.data
-                })
-        
-        return Response(result, status=status.HTTP_200_OK)
+        # Built from one joined query and cached until the catalog changes
+        return Response(menu_engine.get_menu(), status=status.HTTP_200_OK)
+
+
+from decimal import Decimal
+from django.db.models import Sum
+from .models import CategorySalesRollup, OrderStatusRollup, ProductSalesRollup
+
+
+class SalesAnalyticsViewSet(viewsets.ViewSet):
+    """Dashboard reads served from the precomputed rollup tables."""
+    permission_classes = [IsAuthenticated]
+
+    def _rollups(self, request, model, id_param=None):
+        period = request.query_params.get('period', 'day')
+        if period not in ('hour', 'day'):
+            return None, Response(
+                {'detail': 'period must be "hour" or "day".'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        queryset = model.objects.filter(period=period)
+        for param, lookup in (('date_from', 'bucket__gte'), ('date_to', 'bucket__lt')):
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            moment = parse_moment(value, end=param == 'date_to')
+            if moment is None:
+                return None, Response(
+                    {'detail': f'{param} must be an ISO date or datetime.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            queryset = queryset.filter(**{lookup: moment})
+        value = request.query_params.get(id_param) if id_param else None
+        if value:
+            try:
+                queryset = queryset.filter(**{f'{id_param}_id': int(value)})
+            except ValueError:
+                return None, Response(
+                    {'detail': f'{id_param} must be an integer id.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        return queryset, None
+
+    @action(detail=False, methods=['GET'])
+    def products(self, request):
+        queryset, error = self._rollups(request, ProductSalesRollup, 'product')
+        if error:
+            return error
+        rows = queryset.order_by('bucket', 'product_id').values(
+            'bucket', 'product_id', 'product__name', 'revenue', 'units', 'order_count',
+        )
+        return Response([
+            {
+                'bucket': row['bucket'],
+                'product_id': row['product_id'],
+                'product_name': row['product__name'],
+                'revenue': str(row['revenue']),
+                'units': row['units'],
+                'order_count': row['order_count'],
+            }
+            for row in rows
+        ])
+
+    @action(detail=False, methods=['GET'])
+    def categories(self, request):
+        queryset, error = self._rollups(request, CategorySalesRollup, 'category')
+        if error:
+            return error
+        rows = queryset.order_by('bucket', 'category_id').values(
+            'bucket', 'category_id', 'category__name', 'revenue', 'units', 'order_count',
+        )
+        return Response([
+            {
+                'bucket': row['bucket'],
+                'category_id': row['category_id'],
+                'category_name': row['category__name'],
+                'revenue': str(row['revenue']),
+                'units': row['units'],
+                'order_count': row['order_count'],
+            }
+            for row in rows
+        ])
+
+    @action(detail=False, methods=['GET'])
+    def statuses(self, request):
+        queryset, error = self._rollups(request, OrderStatusRollup)
+        if error:
+            return error
+        rows = queryset.order_by('bucket', 'status').values('bucket', 'status', 'order_count')
+        return Response(list(rows))
+
+    @action(detail=False, methods=['GET'])
+    def summary(self, request):
+        sales, error = self._rollups(request, ProductSalesRollup)
+        if error:
+            return error
+        statuses, _ = self._rollups(request, OrderStatusRollup)
+        totals = sales.aggregate(revenue=Sum('revenue'), units=Sum('units'))
+        by_status = dict(statuses.values('status').annotate(count=Sum('order_count')).values_list('status', 'count'))
+        return Response({
+            'revenue': str(totals['revenue'] or Decimal('0.00')),
+            'units': totals['units'] or 0,
+            'orders_by_status': by_status,
+        })
+
+
+from rest_framework.views import APIView
+
 
+class MetricsView(APIView):
+    """Per-endpoint request metrics and background job queue gauges in Prometheus text format."""
+    permission_classes = [CanScrapeMetrics]
+    renderer_classes = [PrometheusTextRenderer]
 
+    def get(self, request):
+        return Response(registry.render() + render_job_metrics())